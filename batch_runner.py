@@ -0,0 +1,234 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from shapely import wkt
+from shapely.geometry import shape
+
+from division_cache import DivisionCache
+from generate_division import DIVISION_STRATEGIES, get_best_divisions, iter_plans_by_division
+from site_profile import SiteProfile
+
+
+def read_sites(path):
+    # yields (site_id, wkt) pairs. GeoJSON files are read as one FeatureCollection, which is loaded
+    # into memory whole; .geojsonl / .geojsons / .ndjson hold one feature per line and, like WKT
+    # files ("id<TAB>WKT" or just WKT per line), are read lazily, so inputs too big for memory
+    # should be given as GeoJSON lines
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".geojson", ".json"):
+        with open(path) as f:
+            collection = json.load(f)
+        features = collection["features"] if collection.get("type") == "FeatureCollection" else [collection]
+        for index, feature in enumerate(features):
+            yield get_feature_id(feature, index), shape(feature["geometry"]).wkt
+    elif extension in (".geojsonl", ".geojsons", ".ndjson"):
+        with open(path) as f:
+            for index, line in enumerate(f):
+                line = line.strip().lstrip("\x1e")
+                if line:
+                    feature = json.loads(line)
+                    yield get_feature_id(feature, index), shape(feature["geometry"]).wkt
+    else:
+        with open(path) as f:
+            for index, line in enumerate(f):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if "\t" in line:
+                    site_id, text = line.split("\t", 1)
+                else:
+                    site_id, text = str(index), line
+                yield site_id, text
+
+
+def get_feature_id(feature, index):
+    if feature.get("id") is not None:
+        return str(feature["id"])
+    properties = feature.get("properties") or {}
+    if properties.get("id") is not None:
+        return str(properties["id"])
+    return str(index)
+
+
+def read_done(path, retry_failed=False):
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a line cut short by an interrupted run, the site will simply be redone
+                continue
+            if record.get("status") == "ok" or not retry_failed:
+                done.add(record["id"])
+    return done
+
+
+def process_site(site_id, text, options):
+    start = time.time()
+    try:
+        # the division search and every plan share one profile of the site
+        base = SiteProfile(wkt.loads(text))
+        cache = DivisionCache(options["cache"]) if options.get("cache") else None
+        divisions, cascaded_roads = get_best_divisions(base, options["min_r"], options["max_r"],
+                                                       time_budget=options.get("time_budget"),
+                                                       max_attempts=options.get("attempts"),
+                                                       seed=options["seed"], cache=cache,
+                                                       strategy=options.get("strategy", "circles"))
+        if divisions is None:
+            raise ValueError("no connected division found")
+        plans = [None] * options["plans"]
+        for kind, i, overall_buildings in iter_plans_by_division(divisions, cascaded_roads, options["plans"],
+                                                                 base=base, seed=options["seed"]):
+            plans[i] = overall_buildings
+        return {
+            "id": site_id,
+            "status": "ok",
+            "seconds": time.time() - start,
+            "divisions": [geom.wkt for geom in divisions],
+            "cascaded_roads": cascaded_roads.wkt,
+            "plans": [plan.wkt if plan is not None else None for plan in plans],
+        }
+    except Exception as e:
+        return {
+            "id": site_id,
+            "status": "error",
+            "seconds": time.time() - start,
+            "error": "{}: {}".format(type(e).__name__, e),
+            "traceback": traceback.format_exc(),
+        }
+
+
+def get_crash_record(site_id, error, seconds=0.0):
+    return {"id": site_id, "status": "error", "seconds": seconds, "error": "{}: {}".format(type(error).__name__, error)}
+
+
+def run_isolated(sites, options, workers):
+    # yields the record of every site, each run in a process of its own (workers at a time), so a
+    # worker that dies takes only its own site down
+    sites = iter(sites)
+    running = {}
+    while True:
+        for site_id, text in itertools.islice(sites, workers - len(running)):
+            executor = ProcessPoolExecutor(max_workers=1)
+            running[executor.submit(process_site, site_id, text, options)] = (site_id, executor, time.time())
+        if not running:
+            return
+        finished, pending = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            site_id, executor, start = running.pop(future)
+            executor.shutdown()
+            try:
+                yield future.result()
+            except Exception as e:
+                yield get_crash_record(site_id, e, time.time() - start)
+
+
+def run_batch(input_path, output_path, options, workers=1, resume=False, retry_failed=False):
+    # results are appended to output_path (JSON lines) as each site finishes. at most 2 * workers
+    # sites are in flight, so memory does not depend on the size of the input
+    done = read_done(output_path, retry_failed) if resume else set()
+    sites = ((site_id, text) for site_id, text in read_sites(input_path) if site_id not in done)
+    counts = {"ok": 0, "error": 0}
+    with open(output_path, "a" if resume else "w") as output:
+        def write(record):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            counts[record["status"]] += 1
+            print("{} {} {:.2f}s".format(record["id"], record["status"], record["seconds"]))
+
+        if workers <= 1:
+            for site_id, text in sites:
+                write(process_site(site_id, text, options))
+            return counts
+
+        executor = ProcessPoolExecutor(max_workers=workers)
+        running = {}
+        # sites that were in the pool when a worker died (e.g. out of memory or a crash in GEOS)
+        suspects = []
+
+        def collect(future):
+            site_id, text = running.pop(future)
+            try:
+                write(future.result())
+            except BrokenProcessPool:
+                suspects.append((site_id, text))
+            except Exception as e:
+                write(get_crash_record(site_id, e))
+
+        try:
+            while True:
+                for site_id, text in itertools.islice(sites, 2 * workers - len(running)):
+                    try:
+                        running[executor.submit(process_site, site_id, text, options)] = (site_id, text)
+                    except BrokenProcessPool:
+                        suspects.append((site_id, text))
+                        break
+                if not running and not suspects:
+                    break
+                if running:
+                    finished, pending = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        collect(future)
+                if suspects:
+                    # a dead worker breaks the whole pool and every site in it fails with it, without
+                    # telling which one crashed. those that did finish are kept, the rest are run again
+                    # one per process so only the site that crashed is recorded as failed
+                    wait(running)
+                    for future in list(running):
+                        collect(future)
+                    executor.shutdown(wait=True)
+                    for record in run_isolated(suspects, options, workers):
+                        write(record)
+                    del suspects[:]
+                    executor = ProcessPoolExecutor(max_workers=workers)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="divide and plan many sites")
+    parser.add_argument("input", help="GeoJSON, GeoJSON lines or WKT lines (optionally id<TAB>WKT); GeoJSON is "
+                                      "loaded whole, use GeoJSON lines for very large inputs")
+    parser.add_argument("output", help="JSON lines output, one record per site")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--plans", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-r", type=int, default=60)
+    parser.add_argument("--max-r", type=int, default=80)
+    parser.add_argument("--attempts", type=int, default=None)
+    parser.add_argument("--time-budget", type=float, default=None, help="seconds per site for the division search")
+    parser.add_argument("--strategy", default="circles", choices=sorted(DIVISION_STRATEGIES))
+    parser.add_argument("--cache", default=None, help="directory of a division cache")
+    parser.add_argument("--resume", action="store_true", help="skip the sites already in the output")
+    parser.add_argument("--retry-failed", action="store_true", help="with --resume, redo the sites that failed")
+    args = parser.parse_args(argv)
+
+    options = {
+        "plans": args.plans,
+        "seed": args.seed,
+        "min_r": args.min_r,
+        "max_r": args.max_r,
+        "attempts": args.attempts,
+        "time_budget": args.time_budget,
+        "cache": args.cache,
+        "strategy": args.strategy,
+    }
+    counts = run_batch(args.input, args.output, options, workers=args.workers, resume=args.resume,
+                       retry_failed=args.retry_failed)
+    print("{} ok, {} failed".format(counts["ok"], counts["error"]))
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from generate_division import generate_division, get_best_divisions
+from mock_bases import series
+from utils import get_entrances, generate_collection, get_roads_v2, smooth_polygons, get_buffered_sections, \
+    generate_plan
+
+STAGES = ["get_entrances", "generate_collection", "get_roads_v2", "generate_division", "get_best_divisions",
+          "generate_plan", "smooth_polygon"]
+
+
+def get_stages(base, seed, min_r=60, max_r=80, attempts=None):
+    # every stage is a no-argument callable; the inputs of the later stages are computed once
+    # up front with the same fixed seed, so each stage is timed on its own
+    distance = math.sqrt(base.area) / 2
+    entrances = get_entrances(base, distance=distance)
+    collection = generate_collection(base, min_r, max_r, resolution=8, density=20, entrace_collection=entrances,
+                                     rng=random.Random(seed))
+    divisions, cascaded_roads = generate_division(base, min_r, max_r, rng=random.Random(seed))
+    place_to_build = base.difference(cascaded_roads)
+    unsmoothed = [place_to_build] if place_to_build.geom_type == "Polygon" else [geom for geom in place_to_build]
+    overall_shadows = base.symmetric_difference(base.envelope.buffer(1)).union(cascaded_roads)
+
+    def plan():
+        rng = random.Random(seed)
+        overall_buildings = None
+        shadows = overall_shadows
+        for buffer in range(-10, -30, -10):
+            overall_buildings, shadows = generate_plan(get_buffered_sections(divisions, buffer), shadows,
+                                                       overall_buildings, rng=rng)
+        return overall_buildings
+
+    return {
+        "get_entrances": lambda: get_entrances(base, distance=distance),
+        "generate_collection": lambda: generate_collection(base, min_r, max_r, resolution=8, density=20,
+                                                           entrace_collection=entrances, rng=random.Random(seed)),
+        "get_roads_v2": lambda: get_roads_v2(collection, base, 2 * max_r),
+        "generate_division": lambda: generate_division(base, min_r, max_r, rng=random.Random(seed)),
+        "get_best_divisions": lambda: get_best_divisions(base, min_r, max_r, seed=seed, max_attempts=attempts),
+        "generate_plan": plan,
+        "smooth_polygon": lambda: smooth_polygons(unsmoothed),
+    }
+
+
+def measure(function, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        function()
+    seconds = time.perf_counter() - start
+    # peak memory is taken in a separate call, tracemalloc would distort the timings.
+    # it only sees memory allocated through Python, not inside GEOS
+    tracemalloc.start()
+    function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "calls": repeat,
+        "seconds": seconds,
+        "seconds_per_call": seconds / repeat,
+        "calls_per_second": repeat / seconds if seconds > 0 else float("inf"),
+        "peak_memory_bytes": peak,
+    }
+
+
+def run_benchmarks(bases=(1, 2, 3, 4, 5), stages=STAGES, repeat=3, seed=0, attempts=None):
+    results = {}
+    for number in bases:
+        base = series[number - 1]
+        site_stages = get_stages(base, seed, attempts=attempts)
+        results["base{}".format(number)] = {stage: measure(site_stages[stage], repeat) for stage in stages}
+    return {
+        "meta": {
+            "seed": seed,
+            "repeat": repeat,
+            "attempts": attempts,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=0.2):
+    # stages that got slower than the baseline by more than the tolerance (0.2 = 20%)
+    regressions = []
+    for site, stages in report["results"].items():
+        for stage, result in stages.items():
+            old = baseline.get("results", {}).get(site, {}).get(stage)
+            if old is None or old["seconds_per_call"] == 0:
+                continue
+            ratio = result["seconds_per_call"] / old["seconds_per_call"]
+            if ratio > 1 + tolerance:
+                regressions.append((site, stage, old["seconds_per_call"], result["seconds_per_call"], ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="time every pipeline stage on the mock bases")
+    parser.add_argument("--bases", type=int, nargs="+", default=[1, 2, 3, 4, 5], choices=range(1, len(series) + 1))
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--attempts", type=int, default=None,
+                        help="attempts for get_best_divisions, by default the area based count")
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="earlier output to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.bases, args.stages, repeat=args.repeat, seed=args.seed, attempts=args.attempts)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for site, stages in report["results"].items():
+        for stage, result in stages.items():
+            print("{:<8}{:<22}{:>10.4f} s/call{:>10.1f} calls/s{:>12.1f} KiB".format(
+                site, stage, result["seconds_per_call"], result["calls_per_second"],
+                result["peak_memory_bytes"] / 1024.0))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for site, stage, old, new, ratio in regressions:
+            print("regression: {} {} {:.4f} s -> {:.4f} s ({:.0%})".format(site, stage, old, new, ratio - 1))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
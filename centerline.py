@@ -0,0 +1,181 @@
+import heapq
+import math
+
+import numpy as np
+from shapely import vectorized
+from shapely.geometry import LineString, MultiLineString
+from shapely.ops import linemerge
+
+from collision import get_parts
+from triangulate import triangulate_points
+
+
+def densify_boundary(polygon, spacing):
+    # points along every ring, no two consecutive ones further apart than spacing
+    chunks = []
+    for part in get_parts(polygon):
+        for ring in [part.exterior] + list(part.interiors):
+            coords = np.asarray(ring.coords)[:, :2]
+            starts = coords[:-1]
+            steps = coords[1:] - starts
+            counts = np.maximum(1, np.ceil(np.hypot(*steps.T) / spacing)).astype(int)
+            segment = np.repeat(np.arange(len(starts)), counts)
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            t = (np.arange(counts.sum()) - first) / counts[segment]
+            chunks.append(starts[segment] + steps[segment] * t[:, None])
+    return np.concatenate(chunks)
+
+
+def get_skeleton_graph(polygon, spacing=None):
+    # chordal axis of the Delaunay triangulation of the densified boundary: the midpoints of the
+    # edges shared by two inner triangles are linked through every inner triangle, triangles with
+    # three inner neighbours are linked through their centroid. returns (positions, adjacency)
+    if spacing is None:
+        spacing = polygon.length / 400.0
+    points = densify_boundary(polygon, spacing)
+    triangulation = triangulate_points(points)
+    triangles = triangulation.triangles
+    centroids = points[triangles].mean(axis=1)
+    inner = vectorized.contains(polygon, centroids[:, 0], centroids[:, 1])
+    neighbors = triangulation.neighbors
+    inner_neighbors = (neighbors != -1) & inner[np.maximum(neighbors, 0)] & inner[:, None]
+
+    positions = {}
+    adjacency = {}
+
+    def add_node(key, position):
+        if key not in positions:
+            positions[key] = position
+            adjacency[key] = set()
+
+    def link(a, b):
+        adjacency[a].add(b)
+        adjacency[b].add(a)
+
+    for t in np.nonzero(inner_neighbors.sum(axis=1) >= 2)[0].tolist():
+        keys = []
+        for i in np.nonzero(inner_neighbors[t])[0].tolist():
+            a, b = sorted((triangles[t, (i + 1) % 3], triangles[t, (i + 2) % 3]))
+            keys.append((a, b))
+            add_node((a, b), (points[a] + points[b]) / 2.0)
+        if len(keys) == 2:
+            link(keys[0], keys[1])
+        else:
+            add_node(("t", t), centroids[t])
+            for key in keys:
+                link(("t", t), key)
+    return positions, adjacency
+
+
+def get_branch(adjacency, leaf):
+    # nodes from a leaf up to the first node that is not on a plain chain
+    path = [leaf]
+    previous = None
+    node = leaf
+    while True:
+        following = [other for other in adjacency[node] if other != previous]
+        if len(following) != 1:
+            return path
+        previous, node = node, following[0]
+        path.append(node)
+        if len(adjacency[node]) != 2:
+            return path
+
+
+def get_path_length(positions, path):
+    return sum(math.hypot(*(positions[a] - positions[b])) for a, b in zip(path[:-1], path[1:]))
+
+
+def prune_branches(positions, adjacency, prune_length):
+    # side branches (leaf to junction) shorter than prune_length are removed, a round at a time
+    # so the branches of one junction are judged together. a junction that would lose every way
+    # out keeps its two longest branches, so something is always left
+    while True:
+        branches = {}
+        for node in adjacency:
+            if len(adjacency[node]) != 1:
+                continue
+            path = get_branch(adjacency, node)
+            if len(adjacency[path[-1]]) < 3:
+                continue
+            length = get_path_length(positions, path)
+            if length < prune_length:
+                branches.setdefault(path[-1], []).append((length, path))
+        if not branches:
+            return
+        removed = False
+        for junction, paths in branches.items():
+            paths.sort(key=lambda item: item[0])
+            if len(paths) == len(adjacency[junction]):
+                paths = paths[:-2]
+            for length, path in paths:
+                removed = True
+                for node in path[:-1]:
+                    for other in adjacency.pop(node):
+                        if other in adjacency:
+                            adjacency[other].discard(node)
+        if not removed:
+            return
+
+
+def get_graph_lines(positions, adjacency):
+    segments = set()
+    for node, others in adjacency.items():
+        for other in others:
+            segments.add(frozenset((node, other)))
+    lines = [LineString([positions[node] for node in segment]) for segment in segments]
+    if not lines:
+        return MultiLineString()
+    return linemerge(lines)
+
+
+def get_pruned_skeleton(polygon, spacing=None, prune_length=None):
+    # spacing is the boundary sampling step (1/400 of the perimeter by default), side branches
+    # shorter than prune_length (twice the mean width, 4 * area / perimeter, by default) are dropped
+    positions, adjacency = get_skeleton_graph(polygon, spacing)
+    if prune_length is None:
+        prune_length = 4.0 * polygon.area / polygon.length
+    prune_branches(positions, adjacency, prune_length)
+    return positions, adjacency
+
+
+def get_centerline(polygon, spacing=None, prune_length=None):
+    # centerline of a site polygon as a (Multi)LineString
+    return get_graph_lines(*get_pruned_skeleton(polygon, spacing, prune_length))
+
+
+def get_farthest(positions, adjacency, start):
+    distances = {start: 0.0}
+    previous = {start: None}
+    heap = [(0.0, 0, start)]
+    counter = 1
+    while heap:
+        distance, _, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        for other in adjacency[node]:
+            new_distance = distance + math.hypot(*(positions[node] - positions[other]))
+            if other not in distances or new_distance < distances[other]:
+                distances[other] = new_distance
+                previous[other] = node
+                heapq.heappush(heap, (new_distance, counter, other))
+                counter += 1
+    end = max(distances, key=distances.get)
+    path = [end]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+    return end, path
+
+
+def get_spine(polygon, spacing=None, prune_length=None):
+    # the longest path through the centerline as one LineString, None for a polygon too small to have one
+    positions, adjacency = get_pruned_skeleton(polygon, spacing, prune_length)
+    if not adjacency:
+        return None
+    # the node farthest from the node farthest from any start spans the skeleton (exactly so when it
+    # is a tree, as for a polygon without holes)
+    start, path = get_farthest(positions, adjacency, next(iter(adjacency)))
+    end, path = get_farthest(positions, adjacency, start)
+    if len(path) < 2:
+        return None
+    return LineString([positions[node] for node in path])
@@ -0,0 +1,259 @@
+import math
+
+import numpy as np
+from shapely import vectorized
+from shapely.geometry import MultiPolygon, GeometryCollection
+from shapely.ops import cascaded_union
+from shapely.prepared import prep
+
+import instrumentation
+
+
+def get_parts(geom):
+    if geom is None or geom.is_empty:
+        return []
+    if isinstance(geom, (MultiPolygon, GeometryCollection)):
+        return [part for part in geom]
+    return [geom]
+
+
+class SpatialIndex(object):
+    # uniform grid hash: every item is registered in each cell its bounding box touches,
+    # so a query only looks at the items stored around the queried bounds
+    def __init__(self, cell_size=50):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.items = {}
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell_range(self, bounds):
+        minx, miny, maxx, maxy = bounds
+        size = self.cell_size
+        return (int(math.floor(minx / size)), int(math.floor(miny / size)),
+                int(math.floor(maxx / size)), int(math.floor(maxy / size)))
+
+    def insert(self, geom):
+        item_id = self.next_id
+        self.next_id += 1
+        bounds = geom.bounds
+        self.items[item_id] = (geom, bounds)
+        x0, y0, x1, y1 = self._cell_range(bounds)
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                self.cells.setdefault((i, j), []).append(item_id)
+        return item_id
+
+    def remove(self, item_id):
+        geom, bounds = self.items.pop(item_id)
+        x0, y0, x1, y1 = self._cell_range(bounds)
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                cell = self.cells[(i, j)]
+                cell.remove(item_id)
+                if not cell:
+                    del self.cells[(i, j)]
+        return geom
+
+    def get(self, item_id):
+        return self.items[item_id][0]
+
+    def query(self, bounds):
+        minx, miny, maxx, maxy = bounds
+        x0, y0, x1, y1 = self._cell_range(bounds)
+        seen = set()
+        for i in range(x0, x1 + 1):
+            for j in range(y0, y1 + 1):
+                for item_id in self.cells.get((i, j), ()):
+                    if item_id in seen:
+                        continue
+                    seen.add(item_id)
+                    geom, (gminx, gminy, gmaxx, gmaxy) = self.items[item_id]
+                    if gminx <= maxx and gmaxx >= minx and gminy <= maxy and gmaxy >= miny:
+                        yield geom
+
+    def intersects(self, geom, bounds=None):
+        if bounds is None:
+            bounds = geom.bounds
+        for other in self.query(bounds):
+            if other.intersects(geom):
+                return True
+        return False
+
+    def geometries(self):
+        return [geom for geom, bounds in self.items.values()]
+
+
+class OccupancyGrid(object):
+    # coarse raster of cells known to lie completely inside the shadows. a candidate with a point in
+    # such a cell surely intersects the shadows; cells are only marked when that is certain, so a
+    # lookup can reject a candidate but never accept one
+    def __init__(self, bounds, cell_size=3.0):
+        minx, miny, maxx, maxy = bounds
+        self.minx = minx
+        self.miny = miny
+        self.cell_size = cell_size
+        self.nx = int(math.ceil((maxx - minx) / cell_size)) + 1
+        self.ny = int(math.ceil((maxy - miny) / cell_size)) + 1
+        self.covered = np.zeros((self.ny, self.nx), dtype=bool)
+
+    def _index_range(self, bounds):
+        minx, miny, maxx, maxy = bounds
+        size = self.cell_size
+        i0 = max(0, int(math.floor((minx - self.minx) / size)))
+        j0 = max(0, int(math.floor((miny - self.miny) / size)))
+        i1 = min(self.nx - 1, int(math.floor((maxx - self.minx) / size)))
+        j1 = min(self.ny - 1, int(math.floor((maxy - self.miny) / size)))
+        return i0, j0, i1, j1
+
+    def _cell_centers(self, i0, j0, i1, j1):
+        size = self.cell_size
+        return np.meshgrid(self.minx + (np.arange(i0, i1 + 1) + 0.5) * size,
+                           self.miny + (np.arange(j0, j1 + 1) + 0.5) * size)
+
+    def mark_geometry(self, geom):
+        # a cell is inside geom when its center is inside geom shrunk by the half diagonal
+        # (with a little extra for the chords the buffer uses instead of arcs)
+        inner = geom.buffer(-self.cell_size * math.sqrt(2) / 2 * 1.05)
+        if inner.is_empty:
+            return
+        i0, j0, i1, j1 = self._index_range(inner.bounds)
+        if i0 > i1 or j0 > j1:
+            return
+        xs, ys = self._cell_centers(i0, j0, i1, j1)
+        inside = vectorized.contains(inner, xs.ravel(), ys.ravel()).reshape(xs.shape)
+        self.covered[j0:j1 + 1, i0:i1 + 1] |= inside
+
+    def mark_rectangle(self, center, rotate_angle, length, width):
+        # a cell is inside the rotated rectangle when its extent along both rectangle axes fits
+        # within the rectangle's half length and half width
+        x, y = center
+        angle = math.radians(rotate_angle)
+        cos = math.cos(angle)
+        sin = math.sin(angle)
+        reach = (abs(cos) * length + abs(sin) * width) / 2, (abs(sin) * length + abs(cos) * width) / 2
+        i0, j0, i1, j1 = self._index_range((x - reach[0], y - reach[1], x + reach[0], y + reach[1]))
+        if i0 > i1 or j0 > j1:
+            return
+        xs, ys = self._cell_centers(i0, j0, i1, j1)
+        u = (xs - x) * cos + (ys - y) * sin
+        v = -(xs - x) * sin + (ys - y) * cos
+        half_cell = self.cell_size * (abs(cos) + abs(sin)) / 2
+        inside = (np.abs(u) + half_cell < length / 2 - 1e-6) & (np.abs(v) + half_cell < width / 2 - 1e-6)
+        self.covered[j0:j1 + 1, i0:i1 + 1] |= inside
+
+    def blocked(self, points):
+        points = np.asarray(points, dtype=float)
+        i = np.floor((points[..., 0] - self.minx) / self.cell_size).astype(int)
+        j = np.floor((points[..., 1] - self.miny) / self.cell_size).astype(int)
+        valid = (i >= 0) & (i < self.nx) & (j >= 0) & (j < self.ny)
+        result = np.zeros(points.shape[:-1], dtype=bool)
+        result[valid] = self.covered[j[valid], i[valid]]
+        return result
+
+
+class CollisionEngine(object):
+    # keeps the accepted buildings and their shadows as separate items instead of two
+    # ever-growing unions; the unions are only built when asked for
+    def __init__(self, overall_shadows=None, overall_buildings=None, cell_size=50, raster_cell=3.0):
+        self.static_shadows = overall_shadows
+        self.prepared_shadows = None
+        self.grid = None
+        self.static_covered = None
+        self.grid_dirty = False
+        if overall_shadows is not None and not overall_shadows.is_empty:
+            self.prepared_shadows = prep(overall_shadows)
+            if raster_cell:
+                self.grid = OccupancyGrid(overall_shadows.bounds, raster_cell)
+                self.grid.mark_geometry(overall_shadows)
+                self.static_covered = self.grid.covered.copy()
+        self.buildings = SpatialIndex(cell_size)
+        self.shadows = SpatialIndex(cell_size)
+        # token -> (building id, shadow id, rectangles, placement) of every added building
+        self.records = {}
+        self.next_token = 0
+        for building in get_parts(overall_buildings):
+            self.buildings.insert(building)
+
+    def hits_shadows(self, building, bounds=None):
+        if self.prepared_shadows is not None and self.prepared_shadows.intersects(building):
+            return True
+        return self.shadows.intersects(building, bounds)
+
+    def hits_buildings(self, shadow):
+        return self.buildings.intersects(shadow)
+
+    def raster_blocked(self, corners):
+        # (N, 4, 2) building corners -> (N,) candidates that surely hit the shadows, probed at
+        # the corners, the edge midpoints and the center of every building
+        corners = np.asarray(corners, dtype=float)
+        if self.grid is None:
+            return np.zeros(len(corners), dtype=bool)
+        if self.grid_dirty:
+            self.rebuild_grid()
+        midpoints = (corners + np.roll(corners, -1, axis=1)) / 2
+        centers = corners.mean(axis=1, keepdims=True)
+        probes = np.concatenate([corners, midpoints, centers], axis=1)
+        return self.grid.blocked(probes).any(axis=1)
+
+    def add(self, building, shadow, rectangles=(), placement=None):
+        # rectangles: (center, angle, length, width) pieces known to lie inside the shadow;
+        # placement: the (cx, cy, angle, length, width) the building was made from.
+        # returns a token that remove takes
+        rectangles = list(rectangles)
+        token = self.next_token
+        self.next_token += 1
+        self.records[token] = (self.buildings.insert(building), self.shadows.insert(shadow), rectangles, placement)
+        if self.grid is not None and not self.grid_dirty:
+            for center, rotate_angle, length, width in rectangles:
+                self.grid.mark_rectangle(center, rotate_angle, length, width)
+        return token
+
+    def remove(self, token):
+        building_id, shadow_id, rectangles, placement = self.records.pop(token)
+        self.buildings.remove(building_id)
+        self.shadows.remove(shadow_id)
+        # coverage cannot be taken back cell by cell, the grid is rebuilt before its next use
+        self.grid_dirty = self.grid is not None
+
+    def get_record(self, token):
+        building_id, shadow_id, rectangles, placement = self.records[token]
+        return self.buildings.get(building_id), self.shadows.get(shadow_id), rectangles, placement
+
+    def rebuild_grid(self):
+        self.grid.covered = self.static_covered.copy()
+        for building_id, shadow_id, rectangles, placement in self.records.values():
+            for center, rotate_angle, length, width in rectangles:
+                self.grid.mark_rectangle(center, rotate_angle, length, width)
+        self.grid_dirty = False
+
+    @property
+    def placements(self):
+        return [record[3] for record in self.records.values() if record[3] is not None]
+
+    def get_buildings(self):
+        buildings = self.buildings.geometries()
+        if not buildings:
+            return None
+        with instrumentation.timer("collision.union_buildings"):
+            overall_buildings = cascaded_union(buildings)
+        if instrumentation.enabled:
+            instrumentation.gauge("collision.buildings", len(buildings))
+            instrumentation.gauge("collision.overall_buildings_vertices",
+                                  instrumentation.count_vertices(overall_buildings))
+        return overall_buildings
+
+    def get_shadows(self):
+        shadows = self.shadows.geometries()
+        if self.static_shadows is not None:
+            shadows.append(self.static_shadows)
+        if not shadows:
+            return None
+        with instrumentation.timer("collision.union_shadows"):
+            overall_shadows = cascaded_union(shadows)
+        if instrumentation.enabled:
+            instrumentation.gauge("collision.overall_shadows_vertices",
+                                  instrumentation.count_vertices(overall_shadows))
+        return overall_shadows
@@ -2,37 +2,15 @@ from shapely.geometry import *
 import geopandas as gpd
 import matplotlib.pyplot as plt
 
-def get_curve(pointA, pointB, pointC):
-    if isinstance(pointA, Point):
-        ax = pointA.x
-        ay = pointA.y
-    else:
-        ax = pointA[0]
-        ay = pointA[1]
-    if isinstance(pointB, Point):
-        bx = pointB.x
-        by = pointB.y
-    else:
-        bx = pointB[0]
-        by = pointB[1]
-    if isinstance(pointC, Point):
-        cx = pointC.x
-        cy = pointC.y
-    else:
-        cx = pointC[0]
-        cy = pointC[1]
-
-    def bc(a, b, c, t):
-        return (1-t)**2*a+2*t*(1-t)*b+t**2*c + 4*(1/4-(t-1/2)**2)*(-1/4*a+b/2-1/4*c)
+from utils import get_xy, quadratic_bezier
 
-    point_list = []
-    for i in range(101):
-        t = i / 100
-        x = bc(ax, bx, cx, t)
-        y = bc(ay, by, cy, t)
-        point_list.append((x, y))
-
-    return LineString(point_list)
+def get_curve(pointA, pointB, pointC):
+    # the quadratic through A, B (at t = 1/2) and C is the bezier with control 2B - (A + C) / 2
+    ax, ay = get_xy(pointA)
+    bx, by = get_xy(pointB)
+    cx, cy = get_xy(pointC)
+    control = (2 * bx - (ax + cx) / 2, 2 * by - (ay + cy) / 2)
+    return LineString(quadratic_bezier((ax, ay), control, (cx, cy), 101, endpoint=True)[0])
 
 pointA = Point((-1, 6))
 pointB = Point((0, 2))
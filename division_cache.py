@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import zlib
+
+from shapely import wkb
+from shapely.errors import ShapelyError
+
+MAGIC = b"DIV1"
+
+
+def encode_divisions(divisions, cascaded_roads):
+    # MAGIC, division count, then every division and the roads as length-prefixed WKB, zlib compressed
+    chunks = [MAGIC, struct.pack("<I", len(divisions))]
+    for geom in list(divisions) + [cascaded_roads]:
+        data = geom.wkb
+        chunks.append(struct.pack("<I", len(data)))
+        chunks.append(data)
+    return zlib.compress(b"".join(chunks))
+
+
+def decode_divisions(payload):
+    data = zlib.decompress(payload)
+    if data[:4] != MAGIC:
+        raise ValueError("not a division cache entry")
+    count, = struct.unpack_from("<I", data, 4)
+    offset = 8
+    geoms = []
+    for i in range(count + 1):
+        length, = struct.unpack_from("<I", data, offset)
+        offset += 4
+        geoms.append(wkb.loads(data[offset:offset + length]))
+        offset += length
+    return geoms[:-1], geoms[-1]
+
+
+class DivisionCache(object):
+    # one file per (base, parameters) key; when the directory grows past max_bytes the least
+    # recently used entries (by modification time, refreshed on every hit) are removed
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, base, **params):
+        digest = hashlib.sha256(base.wkb)
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".div")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                payload = f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            result = decode_divisions(payload)
+        except (ValueError, struct.error, zlib.error, ShapelyError):
+            os.remove(path)
+            return None
+        os.utime(path, None)
+        return result
+
+    def put(self, key, divisions, cascaded_roads):
+        payload = encode_divisions(divisions, cascaded_roads)
+        # write to a temporary file first so a reader never sees half an entry
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            f.write(payload)
+        os.replace(temporary, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".div"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".div"):
+                os.remove(os.path.join(self.directory, name))
@@ -1,31 +1,66 @@
 import datetime
 import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, wait, as_completed, FIRST_COMPLETED
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
+from shapely.affinity import rotate
 from shapely.geometry import *
-from shapely.ops import cascaded_union
+from shapely.ops import cascaded_union, nearest_points
+from shapely.prepared import prep
 
+import instrumentation
+from collision import CollisionEngine, get_parts
 from mock_bases import get_mock_base
-from utils import get_entrances, generate_collection, get_roads_v2, smooth_polygon, get_buffered_sections, generate_plan
+from mondrian import MondrianNode
+from plan import CompactPlan
+from render import PlanRenderer
+from site_profile import get_site_profile, get_base
+from utils import get_entrances, generate_collection, get_roads_v2, smooth_polygons, get_buffered_sections, \
+    iter_place_buildings, place_buildings, get_interaction_distance, split_convex
 
 
-def generate_division(base, min_r=60, max_r=80):
-    distance = math.sqrt(base.area) / 2
-    entrances = get_entrances(base, distance=distance)
-    collection = generate_collection(base, min_r, max_r, resolution=8, density=20, entrace_collection=entrances)
-    coverage = sum([geom.intersection(base).area for geom in collection]) / base.area
+def generate_division(base, min_r=60, max_r=80, rng=random, decompose=False):
+    # with decompose the base is first cut into near-convex parts and circles are packed part by
+    # part, so they do not spill through the notches of concave bases and leave roads unconnected.
+    # base may be a SiteProfile
+    site = get_site_profile(base)
+    base = site.base
+    distance = math.sqrt(site.area) / 2
+    parts = None
+    if decompose:
+        with instrumentation.timer("generate_division.decompose"):
+            parts = split_convex(base, min_area=math.pi * min_r ** 2 / 4)
+    with instrumentation.timer("generate_division.entrances"):
+        entrances = get_entrances(site, distance=distance, parts=parts)
+    with instrumentation.timer("generate_division.collection"):
+        if parts is not None and len(parts) > 1:
+            # a circle on every cut, like the entrances, links the roads of neighbouring parts
+            collection = entrances
+            for part in parts:
+                collection = generate_collection(part, min_r, max_r, resolution=8, density=20,
+                                                 entrace_collection=collection, rng=rng)
+        else:
+            collection = generate_collection(site, min_r, max_r, resolution=8, density=20,
+                                             entrace_collection=entrances, rng=rng)
+    if instrumentation.enabled:
+        coverage = sum([geom.intersection(base).area for geom in collection]) / base.area
+        instrumentation.gauge("generate_division.coverage", coverage)
 
-    display = []
-    display.extend(collection)
-    display.append(base)
-    roads = get_roads_v2(collection, base, 2 * max_r)
-    display.extend(roads)
+    with instrumentation.timer("generate_division.roads"):
+        roads = get_roads_v2(collection, site, 2 * max_r)
 
-    cascaded_entrances = cascaded_union(entrances)
-    cascaded_roads = cascaded_union([road.buffer(4) for road in roads])
-    cascaded_roads = cascaded_union([cascaded_roads, cascaded_entrances])
-    place_to_build = base.difference(cascaded_roads)
+    with instrumentation.timer("generate_division.union"):
+        cascaded_entrances = cascaded_union(entrances)
+        cascaded_roads = cascaded_union([road.buffer(4) for road in roads])
+        cascaded_roads = cascaded_union([cascaded_roads, cascaded_entrances])
+        # the parts are only linked up when their roads did not meet by themselves, every extra
+        # road cuts the divisions smaller
+        if parts is not None and len(parts) > 1 and not check_roads_conected(cascaded_roads):
+            links = get_part_links(parts, collection, base)
+            cascaded_roads = cascaded_union([cascaded_roads] + [link.buffer(4) for link in links])
+        place_to_build = base.difference(cascaded_roads)
     new_collection = []
     if isinstance(place_to_build, Polygon):
         new_collection = [place_to_build]
@@ -33,76 +68,514 @@ def generate_division(base, min_r=60, max_r=80):
         for geom in place_to_build:
             new_collection.append(geom)
     new_collection = sorted(new_collection, key=lambda geom: geom.area)
-    new_collection = [smooth_polygon(geom) for geom in new_collection]
+    with instrumentation.timer("generate_division.smooth"):
+        new_collection = smooth_polygons(new_collection)
+    if instrumentation.enabled:
+        instrumentation.gauge("generate_division.divisions", len(new_collection))
+
+    return new_collection, cascaded_roads
+
+
+def get_orientation(base):
+    # angle in degrees of the longer side of the minimum rotated rectangle
+    coords = list(base.minimum_rotated_rectangle.exterior.coords)
+    edges = [(coords[i + 1][0] - coords[i][0], coords[i + 1][1] - coords[i][1]) for i in range(2)]
+    dx, dy = max(edges, key=lambda edge: math.hypot(*edge))
+    return math.degrees(math.atan2(dy, dx))
+
+
+def generate_mondrian_division(base, min_r=60, max_r=80, rng=random, split_range=(0.4, 0.6), road_width=8):
+    # recursive rectangle subdivision of the oriented bounding box: cells are split across their
+    # longer side until they are no longer than a circle of max_r, the split lines become the roads.
+    # much cheaper than packing circles, and a better fit for rectilinear sites
+    site = get_site_profile(base)
+    base = site.base
+    angle = get_orientation(base)
+    aligned = rotate(base, -angle, origin=(0, 0))
+    minx, miny, maxx, maxy = aligned.bounds
+    with instrumentation.timer("generate_division.subdivide"):
+        tree = MondrianNode()
+        tree.subdivide(maxx - minx, maxy - miny, 2 * max_r, rng=rng, split_range=split_range)
+        lines = [LineString(split) for split in tree.iter_splits(maxx - minx, maxy - miny, minx, miny)]
+
+    with instrumentation.timer("generate_division.union"):
+        entrances = get_entrances(site, distance=math.sqrt(site.area) / 2)
+        roads = cascaded_union([line.buffer(road_width / 2.0) for line in lines])
+        cascaded_roads = rotate(roads, angle, origin=(0, 0)).intersection(base)
+        # every entrance gets a straight road to the closest split line
+        connectors = []
+        if not cascaded_roads.is_empty:
+            for entrance in entrances:
+                target = nearest_points(cascaded_roads, entrance.centroid)[0]
+                connectors.append(LineString([entrance.centroid, target]).buffer(road_width / 2.0))
+        cascaded_roads = cascaded_union([cascaded_roads, cascaded_union(entrances)] + connectors)
+        place_to_build = base.difference(cascaded_roads)
+    # clipping the cells against a concave base can leave slivers nothing fits in
+    new_collection = [geom for geom in get_parts(place_to_build) if geom.area >= min_r ** 2 / 4.0]
+    new_collection = sorted(new_collection, key=lambda geom: geom.area)
+    with instrumentation.timer("generate_division.smooth"):
+        new_collection = smooth_polygons(new_collection)
+    if instrumentation.enabled:
+        instrumentation.gauge("generate_division.divisions", len(new_collection))
 
     return new_collection, cascaded_roads
 
 
+def generate_convex_division(base, min_r=60, max_r=80, rng=random):
+    return generate_division(base, min_r, max_r, rng=rng, decompose=True)
+
+
+DIVISION_STRATEGIES = {
+    "circles": generate_division,
+    "convex": generate_convex_division,
+    "mondrian": generate_mondrian_division,
+}
+
+
+def get_shared_edges(parts):
+    # (i, j, line) for every two parts with a common edge; the cuts are only shared up to
+    # rounding, so one side is compared with the other slightly grown
+    shared_edges = []
+    for i in range(len(parts)):
+        grown = parts[i].buffer(1e-6)
+        for j in range(i + 1, len(parts)):
+            shared = parts[j].boundary.intersection(grown)
+            if shared.length > 1e-3:
+                shared_edges.append((i, j, shared))
+    return shared_edges
+
+
+def get_part_links(parts, collection, base):
+    # one road across every cut between two parts, from the closest circle on one side through
+    # the middle of the cut to the closest circle on the other
+    centroids = [geom.centroid for geom in collection]
+    inside = prep(base.buffer(1e-6))
+    links = []
+    for i, j, shared in get_shared_edges(parts):
+        middle = shared.interpolate(0.5, normalized=True)
+        ends = []
+        for part in (parts[i], parts[j]):
+            candidates = [centroid for centroid in centroids if part.contains(centroid)]
+            # a part too small to get a circle is crossed through its middle instead
+            ends.append(min(candidates, key=middle.distance) if candidates else part.representative_point())
+        link = LineString([ends[0], middle, ends[1]])
+        if inside.contains(link):
+            links.append(link)
+    return links
+
+
 def check_roads_conected(cascaded_roads):
     return isinstance(cascaded_roads, Polygon)
 
 
-def get_best_divisions(base):
-    def get_max_attemps(base):
-        area = base.area
-        if area < 10000:
-            return 5
-        elif area < 50000:
-            return 10
-        elif area < 100000:
-            return 15
-        else:
-            return 25
-
-    divisions = None
-    cascaded_roads = None
-    timeout = 0
-    area_rate = 9999
-    while timeout < get_max_attemps(base):
-        timeout += 1
-        my_divisions, my_cascaded_roads = generate_division(base)
-        areas = [geom.area for geom in my_divisions]
-        my_area_rate = max(areas) / min(areas)
-        if check_roads_conected(my_cascaded_roads) and my_area_rate < area_rate:
-            divisions = my_divisions
-            cascaded_roads = my_cascaded_roads
-            area_rate = my_area_rate
+def get_max_attemps(base):
+    area = base.area
+    if area < 10000:
+        return 5
+    elif area < 50000:
+        return 10
+    elif area < 100000:
+        return 15
+    else:
+        return 25
+
+
+def get_area_rate(divisions):
+    areas = [geom.area for geom in divisions]
+    if not areas or min(areas) == 0:
+        return float("inf")
+    return max(areas) / min(areas)
+
+
+def division_attempt(base, seed, min_r=60, max_r=80, strategy="circles"):
+    divisions, cascaded_roads = DIVISION_STRATEGIES[strategy](base, min_r=min_r, max_r=max_r, rng=random.Random(seed))
     return divisions, cascaded_roads
 
 
+def get_best_divisions(base, min_r=60, max_r=80, workers=1, time_budget=None, target_area_rate=None,
+                       max_attempts=None, seed=None, cache=None, strategy="circles"):
+    # strategy is a key of DIVISION_STRATEGIES. every attempt shares one SiteProfile of the base.
+    # only searches that give the same answer on every run are cached: an unseeded one is meant
+    # to give a new answer every time, a time-budgeted one depends on how fast the machine is, and
+    # a parallel one that stops at the target rate depends on which attempt happens to finish first
+    site = get_site_profile(base)
+    reproducible = time_budget is None and (workers <= 1 or target_area_rate is None)
+    if cache is not None and seed is not None and reproducible:
+        key = cache.key(site.base, min_r=min_r, max_r=max_r, seed=seed,
+                        target_area_rate=target_area_rate, max_attempts=max_attempts, strategy=strategy)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        divisions, cascaded_roads = get_best_divisions(site, min_r, max_r, workers=workers, time_budget=time_budget,
+                                                       target_area_rate=target_area_rate,
+                                                       max_attempts=max_attempts, seed=seed, strategy=strategy)
+        if divisions is not None:
+            cache.put(key, divisions, cascaded_roads)
+        return divisions, cascaded_roads
+
+    # without a time budget the number of attempts scales with the area, as before;
+    # with one, attempts keep coming until the budget is spent or the target rate is met
+    if strategy not in DIVISION_STRATEGIES:
+        raise ValueError("unknown division strategy {!r}".format(strategy))
+    if max_attempts is None and time_budget is None:
+        max_attempts = get_max_attemps(site.base)
+    deadline = None if time_budget is None else time.time() + time_budget
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    best = {"divisions": None, "cascaded_roads": None, "area_rate": float("inf")}
+
+    def consider(my_divisions, my_cascaded_roads):
+        if instrumentation.enabled:
+            instrumentation.count("get_best_divisions.attempts")
+        my_area_rate = get_area_rate(my_divisions)
+        if check_roads_conected(my_cascaded_roads) and my_area_rate < best["area_rate"]:
+            best["divisions"] = my_divisions
+            best["cascaded_roads"] = my_cascaded_roads
+            best["area_rate"] = my_area_rate
+
+    def out_of_time():
+        return deadline is not None and time.time() >= deadline
+
+    def target_met():
+        return target_area_rate is not None and best["divisions"] is not None and \
+            best["area_rate"] <= target_area_rate
+
+    def finished(attempt):
+        if target_met() or out_of_time():
+            return True
+        return max_attempts is not None and attempt >= max_attempts
+
+    attempt = 0
+    if workers <= 1:
+        while not finished(attempt):
+            consider(*division_attempt(site, seed + attempt, min_r, max_r, strategy))
+            attempt += 1
+        return best["divisions"], best["cascaded_roads"]
+
+    site.precompute()
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        running = set()
+        while True:
+            while not finished(attempt) and len(running) < workers:
+                running.add(executor.submit(division_attempt, site, seed + attempt, min_r, max_r, strategy))
+                attempt += 1
+            if not running or target_met() or out_of_time():
+                break
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            done, running = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                consider(*future.result())
+    finally:
+        # do not wait for attempts that are still running once we have what we need
+        executor.shutdown(wait=False, cancel_futures=True)
+    return best["divisions"], best["cascaded_roads"]
+
+
+def get_overall_shadows(base, cascaded_roads):
+    # use base.envelope.buffer in case the envelope is exactly the base
+    return cascaded_union([get_site_profile(base).exterior_mask, cascaded_roads])
+
+
+def iter_single_plan(divisions, cascaded_roads, base, seed=None,
+                     building_length=32, building_width=16, fix_angle=None, shadow_h=80, overall_shadows=None):
+    # yields the collision engine every time a section has been filled. overall_shadows is
+    # get_overall_shadows(base, cascaded_roads), for callers that already have it
+    rng = random.Random(seed)
+    if overall_shadows is None:
+        overall_shadows = get_overall_shadows(base, cascaded_roads)
+    engine = CollisionEngine(overall_shadows)
+    for buffer in range(-10, -30, -10):
+        new_collection_buffered = get_buffered_sections(divisions, buffer)
+        for section in iter_place_buildings(new_collection_buffered, engine, building_length=building_length,
+                                            building_width=building_width, shadow_h=shadow_h, fix_angle=fix_angle,
+                                            rng=rng):
+            yield engine
+
+
+# below this many divisions generate_clustered_plan places its groups serially: the merge and the
+# refill of the border divisions stay serial and cost about as much as the groups save on smaller sites
+MIN_PARALLEL_DIVISIONS = 100
+
+
+def get_close_divisions(divisions, reach):
+    # index pairs of divisions closer than reach, buildings in two other divisions never interact
+    bounds = [geom.bounds for geom in divisions]
+    pairs = []
+    for i in range(len(divisions)):
+        minx, miny, maxx, maxy = bounds[i]
+        for j in range(i + 1, len(divisions)):
+            dminx, dminy, dmaxx, dmaxy = bounds[j]
+            if dminx > maxx + reach or dmaxx < minx - reach or dminy > maxy + reach or dmaxy < miny - reach:
+                continue
+            if divisions[i].distance(divisions[j]) <= reach:
+                pairs.append((i, j))
+    return pairs
+
+
+def get_division_clusters(divisions, reach, pairs=None):
+    # connected components of the "closer than reach" graph, as sorted index lists. pairs is
+    # get_close_divisions(divisions, reach), for callers that already have it
+    parents = list(range(len(divisions)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    if pairs is None:
+        pairs = get_close_divisions(divisions, reach)
+    for i, j in pairs:
+        parents[find(i)] = find(j)
+    clusters = {}
+    for i in range(len(divisions)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values())
+
+
+def split_cluster(divisions, cluster):
+    # halves a cluster with about the same area on both sides, cut across its longer side
+    minx = min(divisions[i].bounds[0] for i in cluster)
+    miny = min(divisions[i].bounds[1] for i in cluster)
+    maxx = max(divisions[i].bounds[2] for i in cluster)
+    maxy = max(divisions[i].bounds[3] for i in cluster)
+    axis = 0 if maxx - minx >= maxy - miny else 1
+    ordered = sorted(cluster, key=lambda i: divisions[i].centroid.coords[0][axis])
+    total = sum(divisions[i].area for i in ordered)
+    area = 0
+    for k, i in enumerate(ordered[:-1]):
+        area += divisions[i].area
+        if area >= total / 2:
+            break
+    return sorted(ordered[:k + 1]), sorted(ordered[k + 1:])
+
+
+def get_division_groups(divisions, reach, groups, pairs=None):
+    # independent clusters are packed into at most `groups` groups of similar area; when there are
+    # fewer clusters than groups the largest ones are cut, the buildings along the cuts are
+    # reconciled after placement
+    parts = get_division_clusters(divisions, reach, pairs)
+
+    def area(part):
+        return sum(divisions[i].area for i in part)
+
+    while len(parts) < groups:
+        splittable = [part for part in parts if len(part) > 1]
+        if not splittable:
+            break
+        largest = max(splittable, key=area)
+        parts.remove(largest)
+        parts.extend(split_cluster(divisions, largest))
+    parts.sort(key=area, reverse=True)
+    bins = [[] for i in range(min(groups, len(parts)))]
+    for part in parts:
+        min(bins, key=area).extend(part)
+    return sorted(sorted(group) for group in bins)
+
+
+def place_division_group(divisions, overall_shadows, seed=None,
+                         building_length=32, building_width=16, fix_angle=None, shadow_h=80):
+    # runs in a worker process, returns the engine records of the buildings placed in divisions.
+    # it gets the overall shadows of the plan rather than the base, so no worker unions them again
+    engine = None
+    for engine in iter_single_plan(divisions, None, None, seed, building_length=building_length,
+                                   building_width=building_width, fix_angle=fix_angle, shadow_h=shadow_h,
+                                   overall_shadows=overall_shadows):
+        pass
+    if engine is None:
+        return []
+    return [engine.get_record(token) for token in engine.records]
+
+
+def generate_clustered_plan(divisions, cascaded_roads, base, seed=None, workers=2, groups=None,
+                            building_length=32, building_width=16, fix_angle=None, shadow_h=80, compact=False,
+                            executor=None, min_parallel_divisions=MIN_PARALLEL_DIVISIONS):
+    # one plan with its divisions placed in parallel: divisions are grouped so that few of them
+    # are within shadow reach of another group, every group is placed on its own, then the groups
+    # are merged and the buildings that now collide across a group border are dropped. the
+    # divisions on such a border get a last serial pass to fill the gaps.
+    # the plan depends on seed and groups (workers by default), not on scheduling: the groups run
+    # on executor when one is given (it is left running for the next plan), otherwise on a pool of
+    # their own, or one after the other in this process for sites of fewer than
+    # min_parallel_divisions divisions, or when there is only one cpu, where a pool costs more
+    # than it saves
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    kwargs = dict(building_length=building_length, building_width=building_width, fix_angle=fix_angle,
+                  shadow_h=shadow_h)
+    reach = get_interaction_distance(building_length, building_width, shadow_h)
+    pairs = get_close_divisions(divisions, reach)
+    division_groups = get_division_groups(divisions, reach, groups or workers, pairs)
+    group_seeds = ["{}:{}".format(seed, k) for k in range(len(division_groups))]
+    overall_shadows = get_overall_shadows(base, cascaded_roads)
+    group_divisions = [[divisions[i] for i in group] for group in division_groups]
+    parallel = len(division_groups) > 1 and (executor is not None or (
+        workers > 1 and len(divisions) >= min_parallel_divisions and (os.cpu_count() or 1) > 1))
+    with instrumentation.timer("generate_plan.place_groups"):
+        if parallel:
+            own_executor = executor is None
+            if own_executor:
+                executor = ProcessPoolExecutor(max_workers=min(workers, len(division_groups)))
+            try:
+                futures = [executor.submit(place_division_group, group, overall_shadows, group_seed, **kwargs)
+                           for group, group_seed in zip(group_divisions, group_seeds)]
+                group_records = [future.result() for future in futures]
+            finally:
+                if own_executor:
+                    executor.shutdown()
+        else:
+            group_records = [place_division_group(group, overall_shadows, group_seed, **kwargs)
+                             for group, group_seed in zip(group_divisions, group_seeds)]
+
+    with instrumentation.timer("generate_plan.merge_groups"):
+        engine = CollisionEngine(overall_shadows)
+        dropped = 0
+        for records in group_records:
+            for building, shadow, rectangles, placement in records:
+                if engine.hits_shadows(building) or engine.hits_buildings(shadow):
+                    dropped += 1
+                    continue
+                engine.add(building, shadow, rectangles, placement)
+        if instrumentation.enabled:
+            instrumentation.count("generate_plan.dropped_at_merge", dropped)
+        if dropped:
+            group_of = {}
+            for k, group in enumerate(division_groups):
+                for i in group:
+                    group_of[i] = k
+            border = sorted(set(i for pair in pairs if group_of[pair[0]] != group_of[pair[1]] for i in pair))
+            rng = random.Random("{}:border".format(seed))
+            for buffer in range(-10, -30, -10):
+                place_buildings(get_buffered_sections([divisions[i] for i in border], buffer), engine, rng=rng,
+                                **kwargs)
+    return get_engine_plan(engine, compact)
+
+
+def get_engine_plan(engine, compact=False):
+    if compact:
+        return CompactPlan.from_placements(engine.placements if engine is not None else [])
+    return engine.get_buildings() if engine is not None else None
+
+
+def count_buildings(plan):
+    if isinstance(plan, CompactPlan):
+        return len(plan)
+    return len(get_parts(plan))
+
+
+def generate_single_plan(divisions, cascaded_roads, base, seed=None,
+                         building_length=32, building_width=16, fix_angle=None, shadow_h=80, compact=False,
+                         division_workers=1, division_executor=None):
+    # with division_workers > 1 the divisions are placed in groups, see generate_clustered_plan
+    if division_workers > 1:
+        return generate_clustered_plan(divisions, cascaded_roads, base, seed, workers=division_workers,
+                                       building_length=building_length, building_width=building_width,
+                                       fix_angle=fix_angle, shadow_h=shadow_h, compact=compact,
+                                       executor=division_executor)
+    engine = None
+    with instrumentation.timer("generate_plan.place_buildings"):
+        for engine in iter_single_plan(divisions, cascaded_roads, base, seed, building_length=building_length,
+                                       building_width=building_width, fix_angle=fix_angle, shadow_h=shadow_h):
+            pass
+    return get_engine_plan(engine, compact)
+
+
+def iter_plans_by_division(divisions, cascaded_roads, plan_number=10,
+                           building_length=32, building_width=16, fix_angle=None, shadow_h=80,
+                           base=None, workers=1, seed=None, progress=False,
+                           enough_plans=None, min_buildings=0, deadline=None, compact=False):
+    # yields ("plan", i, overall_buildings) as soon as plan i is done and, with progress and a
+    # single worker, ("progress", i, buildings placed so far) after every section.
+    # stops once enough_plans plans with at least min_buildings buildings were yielded, or when
+    # deadline (seconds from the call) has passed; work that is still running is dropped.
+    # with compact the plans are CompactPlans instead of unioned geometries
+    if base is None:
+        raise ValueError("iter_plans_by_division needs the base the divisions were made from")
+    # every plan starts from the same exterior mask, worked out once
+    base = get_site_profile(base)
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    # every plan has its own seed, so the plans do not depend on how many workers run them
+    seeds = [seed + i for i in range(plan_number)]
+    kwargs = dict(building_length=building_length, building_width=building_width, fix_angle=fix_angle,
+                  shadow_h=shadow_h)
+    plan_kwargs = dict(kwargs, compact=compact)
+    stop_at = None if deadline is None else time.time() + deadline
+    good_plans = [0]
+
+    def out_of_time():
+        return stop_at is not None and time.time() >= stop_at
+
+    def count_plan(overall_buildings):
+        if count_buildings(overall_buildings) >= min_buildings:
+            good_plans[0] += 1
+        return enough_plans is not None and good_plans[0] >= enough_plans
+
+    if workers > 1:
+        base.precompute(inward_buffers=())
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = {executor.submit(generate_single_plan, divisions, cascaded_roads, base, plan_seed,
+                                       **plan_kwargs): i
+                       for i, plan_seed in enumerate(seeds)}
+            timeout = None if stop_at is None else max(0, stop_at - time.time())
+            try:
+                for future in as_completed(futures, timeout=timeout):
+                    overall_buildings = future.result()
+                    yield "plan", futures[future], overall_buildings
+                    if count_plan(overall_buildings) or out_of_time():
+                        return
+            except TimeoutError:
+                return
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    else:
+        for i, plan_seed in enumerate(seeds):
+            engine = None
+            for engine in iter_single_plan(divisions, cascaded_roads, base, plan_seed, **kwargs):
+                if out_of_time():
+                    return
+                if progress:
+                    yield "progress", i, len(engine.buildings)
+            overall_buildings = get_engine_plan(engine, compact)
+            yield "plan", i, overall_buildings
+            if count_plan(overall_buildings) or out_of_time():
+                return
+
+
 def generate_plans_by_division(divisions, cascaded_roads, plan_number=10,
-                               building_length=32, building_width=16, fix_angle=None, shadow_h=80):
-    plan_list = []
-    for i in range(plan_number):
-        overall_buildings = None
-        overall_shadows = cascaded_union([base.symmetric_difference(base.envelope.buffer(1)), cascaded_roads])
-        # use base.envelope.buffer in case the envelope is exactly the base
-        list_to_display = []
-        building_lines = []
-        for buffer in range(-10, -30, -10):
-            new_collection_buffered = get_buffered_sections(divisions, buffer)
-            overall_buildings, overall_shadows = generate_plan(new_collection_buffered, overall_shadows,
-                                                               overall_buildings, building_length=building_length,
-                                                               building_width=building_width, shadow_h=shadow_h,
-                                                               fix_angle=fix_angle)
-
-        list_to_display.extend(overall_buildings)
-        list_to_display.extend(divisions)
-        list_to_display.append(base)
-        # list_to_display.append(cascaded_roads)
-        # list_to_display.extend(building_lines)
-        gpd.GeoSeries(list_to_display).plot()
-        plt.savefig("{}.png".format(i))
-        print(len(overall_buildings))
-        plan_list.append(overall_buildings)
+                               building_length=32, building_width=16, fix_angle=None, shadow_h=80,
+                               base=None, workers=1, seed=None, render=True, renderer=None):
+    if base is None:
+        raise ValueError("generate_plans_by_division needs the base the divisions were made from")
+    own_renderer = render and renderer is None
+    if own_renderer:
+        renderer = PlanRenderer()
+
+    plan_list = [None] * plan_number
+    for kind, i, overall_buildings in iter_plans_by_division(divisions, cascaded_roads, plan_number,
+                                                             building_length=building_length,
+                                                             building_width=building_width, fix_angle=fix_angle,
+                                                             shadow_h=shadow_h, base=base, workers=workers,
+                                                             seed=seed):
+        plan_list[i] = overall_buildings
+        print(len(get_parts(overall_buildings)))
+        if render:
+            renderer.submit(i, overall_buildings, divisions, get_base(base))
+    if own_renderer:
+        renderer.close()
     return plan_list
 
 
 if __name__ == "__main__":
+    import geopandas as gpd
+
     base = get_mock_base(4)
     d1 = datetime.datetime.now()
     divisions, cascaded_roads = get_best_divisions(base)
     gpd.GeoSeries(divisions).plot()
-    plans = generate_plans_by_division(divisions, cascaded_roads, plan_number=10)
+    plans = generate_plans_by_division(divisions, cascaded_roads, plan_number=10, base=base)
     print(datetime.datetime.now() - d1)
-    # plt.show()
+    # import matplotlib.pyplot as plt; plt.show()
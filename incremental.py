@@ -0,0 +1,131 @@
+import random
+
+from collision import CollisionEngine
+from generate_division import get_overall_shadows
+from plan import CompactPlan
+from site_profile import get_site_profile
+from utils import get_buffered_sections, place_buildings, get_interaction_distance
+
+BUFFERS = range(-10, -30, -10)
+
+
+class IncrementalPlanner(object):
+    # keeps one plan of a site up to date while its divisions or roads are edited. every division
+    # remembers its buffered sections and the buildings placed from them; an edit only replans the
+    # divisions that changed plus the ones close enough to share shadows with them
+    def __init__(self, base, divisions, cascaded_roads, building_length=32, building_width=16, fix_angle=None,
+                 shadow_h=80, seed=None):
+        self.site = get_site_profile(base)
+        self.cascaded_roads = cascaded_roads
+        self.settings = dict(building_length=building_length, building_width=building_width, fix_angle=fix_angle,
+                             shadow_h=shadow_h)
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.revision = 0
+        self.reach = get_interaction_distance(building_length, building_width, shadow_h)
+        self.engine = CollisionEngine(get_overall_shadows(self.site, cascaded_roads))
+        self.states = [self.new_state(division) for division in divisions]
+        self.place(range(len(self.states)))
+
+    @property
+    def divisions(self):
+        return [state["division"] for state in self.states]
+
+    def new_state(self, division):
+        return {"division": division, "sections": {}, "tokens": []}
+
+    def get_sections(self, state, buffer):
+        if buffer not in state["sections"]:
+            state["sections"][buffer] = get_buffered_sections([state["division"]], buffer)
+        return state["sections"][buffer]
+
+    def get_neighbours(self, geoms):
+        # divisions closer than the interaction distance to any of geoms
+        neighbours = set()
+        for geom in geoms:
+            minx, miny, maxx, maxy = geom.bounds
+            for index, state in enumerate(self.states):
+                if index in neighbours:
+                    continue
+                division = state["division"]
+                dminx, dminy, dmaxx, dmaxy = division.bounds
+                if dminx > maxx + self.reach or dmaxx < minx - self.reach or \
+                        dminy > maxy + self.reach or dmaxy < miny - self.reach:
+                    continue
+                if geom.distance(division) <= self.reach:
+                    neighbours.add(index)
+        return neighbours
+
+    def place(self, indices):
+        indices = sorted(indices)
+        for index in indices:
+            for token in self.states[index]["tokens"]:
+                self.engine.remove(token)
+            self.states[index]["tokens"] = []
+        rng = random.Random("{}:{}".format(self.seed, self.revision))
+        self.revision += 1
+        for buffer in BUFFERS:
+            order = list(indices)
+            rng.shuffle(order)
+            for index in order:
+                state = self.states[index]
+                start = self.engine.next_token
+                place_buildings(list(self.get_sections(state, buffer)), self.engine, rng=rng, **self.settings)
+                state["tokens"].extend(range(start, self.engine.next_token))
+
+    def rebuild_engine(self):
+        # a new static mask, the buildings that are kept move over without being tested again
+        engine = CollisionEngine(get_overall_shadows(self.site, self.cascaded_roads))
+        for state in self.states:
+            state["tokens"] = [engine.add(*self.engine.get_record(token)) for token in state["tokens"]]
+        self.engine = engine
+
+    def update(self, divisions=None, cascaded_roads=None):
+        # takes the edited layout, returns the indices of the divisions that were planned again.
+        # divisions are matched to the previous ones by geometry, so the list may be reordered,
+        # grow or shrink
+        dirty = set()
+        changed = []
+        if divisions is not None:
+            previous = {}
+            for state in self.states:
+                previous.setdefault(state["division"].wkb, []).append(state)
+            states = []
+            for index, division in enumerate(divisions):
+                matches = previous.get(division.wkb)
+                if matches:
+                    states.append(matches.pop())
+                else:
+                    states.append(self.new_state(division))
+                    dirty.add(index)
+                    changed.append(division)
+            for matches in previous.values():
+                for state in matches:
+                    for token in state["tokens"]:
+                        self.engine.remove(token)
+                    changed.append(state["division"])
+            self.states = states
+
+        if cascaded_roads is not None and not cascaded_roads.equals(self.cascaded_roads):
+            self.cascaded_roads = cascaded_roads
+            self.rebuild_engine()
+            mask = self.engine.prepared_shadows
+            for index, state in enumerate(self.states):
+                for token in state["tokens"]:
+                    if mask.intersects(self.engine.get_record(token)[0]):
+                        dirty.add(index)
+                        break
+
+        dirty |= self.get_neighbours(changed + [self.states[index]["division"] for index in dirty])
+        self.place(dirty)
+        return sorted(dirty)
+
+    def replace_division(self, index, division):
+        divisions = self.divisions
+        divisions[index] = division
+        return self.update(divisions)
+
+    def get_buildings(self):
+        return self.engine.get_buildings()
+
+    def get_plan(self):
+        return CompactPlan.from_placements(self.engine.placements)
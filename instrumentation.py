@@ -0,0 +1,144 @@
+import json
+import threading
+import time
+
+# opt-in counters, timers and gauges for the placement pipeline. everything is off by
+# default: the call sites check `enabled` (or get the shared null timer) and do nothing else.
+# the state is per process: counters recorded in process-pool workers (generate_plans with
+# workers > 1, generate_single_plan with division_workers > 1, batch_runner) are not collected
+# back into the parent, and hooks registered in the parent are not called there
+enabled = False
+counters = {}
+timers = {}
+gauges = {}
+hooks = []
+_lock = threading.Lock()
+
+
+class NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer(object):
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def enable(hook=None):
+    global enabled
+    if hook is not None and hook not in hooks:
+        hooks.append(hook)
+    enabled = True
+
+
+def remove_hook(hook):
+    if hook in hooks:
+        hooks.remove(hook)
+
+
+def disable(hook=None):
+    # with a hook only that hook is removed and recording goes on, without one recording stops
+    # and every hook is removed
+    global enabled
+    if hook is not None:
+        remove_hook(hook)
+        return
+    enabled = False
+    del hooks[:]
+
+
+def reset():
+    with _lock:
+        counters.clear()
+        timers.clear()
+        gauges.clear()
+
+
+def _emit(kind, name, value):
+    for hook in hooks:
+        hook(kind, name, value)
+
+
+def timer(name):
+    if not enabled:
+        return NULL_TIMER
+    return Timer(name)
+
+
+def add_time(name, seconds):
+    if not enabled:
+        return
+    with _lock:
+        record = timers.setdefault(name, {"calls": 0, "seconds": 0.0})
+        record["calls"] += 1
+        record["seconds"] += seconds
+    _emit("timer", name, seconds)
+
+
+def count(name, n=1):
+    if not enabled:
+        return
+    with _lock:
+        counters[name] = counters.get(name, 0) + n
+    _emit("counter", name, n)
+
+
+def gauge(name, value):
+    if not enabled:
+        return
+    with _lock:
+        record = gauges.get(name)
+        if record is None:
+            gauges[name] = {"last": value, "min": value, "max": value, "count": 1, "total": value}
+        else:
+            record["last"] = value
+            record["min"] = min(record["min"], value)
+            record["max"] = max(record["max"], value)
+            record["count"] += 1
+            record["total"] += value
+    _emit("gauge", name, value)
+
+
+def count_vertices(geom):
+    if geom is None or geom.is_empty:
+        return 0
+    if hasattr(geom, "geoms"):
+        return sum(count_vertices(part) for part in geom.geoms)
+    if geom.geom_type == "Polygon":
+        return len(geom.exterior.coords) + sum(len(interior.coords) for interior in geom.interiors)
+    return len(geom.coords)
+
+
+def snapshot():
+    with _lock:
+        return {
+            "counters": dict(counters),
+            "timers": {name: dict(record) for name, record in timers.items()},
+            "gauges": {name: dict(record) for name, record in gauges.items()},
+        }
+
+
+def to_json(path=None, **kwargs):
+    text = json.dumps(snapshot(), sort_keys=True, **kwargs)
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(text)
+    return text
@@ -1,31 +1,85 @@
+import argparse
 import random
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
-import pygame
-
-pygame.init()
+import numpy as np
+from matplotlib import image
 
 
 class MondrianNode(object):
+    # pygame is only needed for drawing, it is imported there so the tree itself can be used headless
     def __init__(self):
         self.children = []
         self.subdivide_point = 0.0
         self.subdivide_direction = "horizontal"
-        self.colour = pygame.Color(255, 0, 0)
-
-    def generate(self, chance_of_end=0.0, max_levels=10.0):
-        self.colour.r = random.randint(0, 255)
-        self.colour.g = random.randint(0, 255)
-        self.colour.b = random.randint(0, 255)
-        if random.random() > chance_of_end:  # Decide whether to stop subdividing
-            self.subdivide_direction = random.choice(["horizontal", "vertical"])
-            self.subdivide_point = random.uniform(0.4, 0.6)
+        self.colour = (255, 0, 0)
+
+    def generate(self, chance_of_end=0.0, max_levels=10.0, rng=random, split_range=(0.4, 0.6)):
+        self.colour = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255))
+        if rng.random() > chance_of_end:  # Decide whether to stop subdividing
+            self.subdivide_direction = rng.choice(["horizontal", "vertical"])
+            self.subdivide_point = rng.uniform(*split_range)
             self.children = [MondrianNode(), MondrianNode()]
             new_chance_of_end = chance_of_end + 1.0 / max_levels
             for child in self.children:
-                child.generate(new_chance_of_end, max_levels)
+                child.generate(new_chance_of_end, max_levels, rng, split_range)
+
+    def subdivide(self, width, height, max_size, rng=random, split_range=(0.4, 0.6)):
+        # splits across the longer side until no leaf is longer than max_size
+        if max(width, height) <= max_size:
+            return
+        self.subdivide_direction = "horizontal" if width >= height else "vertical"
+        self.subdivide_point = rng.uniform(*split_range)
+        self.children = [MondrianNode(), MondrianNode()]
+        for child, (child_width, child_height) in zip(self.children, self.get_child_sizes(width, height)):
+            child.subdivide(child_width, child_height, max_size, rng, split_range)
+
+    def get_child_sizes(self, width, height):
+        if self.subdivide_direction == "horizontal":
+            return [(width * self.subdivide_point, height), (width * (1.0 - self.subdivide_point), height)]
+        return [(width, height * self.subdivide_point), (width, height * (1.0 - self.subdivide_point))]
+
+    def get_child_positions(self, width, height, xpos, ypos):
+        if self.subdivide_direction == "horizontal":
+            return [(xpos, ypos), (xpos + width * self.subdivide_point, ypos)]
+        return [(xpos, ypos), (xpos, ypos + height * self.subdivide_point)]
+
+    def iter_splits(self, width, height, xpos, ypos):
+        # the split lines as ((x0, y0), (x1, y1)), parents before children
+        if not self.children:
+            return
+        if self.subdivide_direction == "horizontal":
+            x = xpos + width * self.subdivide_point
+            yield (x, ypos), (x, ypos + height)
+        else:
+            y = ypos + height * self.subdivide_point
+            yield (xpos, y), (xpos + width, y)
+        for child, size, position in zip(self.children, self.get_child_sizes(width, height),
+                                         self.get_child_positions(width, height, xpos, ypos)):
+            for split in child.iter_splits(size[0], size[1], position[0], position[1]):
+                yield split
+
+    def get_rectangles(self, width, height, xpos=0, ypos=0, min_size=100):
+        # every node draw would paint, in the same order, as rows of (x, y, width, height, r, g, b)
+        rows = []
+        stack = [(self, width, height, xpos, ypos)]
+        while stack:
+            node, width, height, xpos, ypos = stack.pop()
+            if width < min_size or height < min_size:
+                continue
+            rows.append((xpos, ypos, width, height) + tuple(node.colour))
+            if node.children:
+                # reversed so the first child is painted first, as in draw
+                children = zip(node.children, node.get_child_sizes(width, height),
+                               node.get_child_positions(width, height, xpos, ypos))
+                for child, size, position in reversed(list(children)):
+                    stack.append((child, size[0], size[1], position[0], position[1]))
+        return np.array(rows, dtype=float).reshape(-1, 7)
 
     def draw(self, surface, width, height, xpos, ypos):
+        import pygame
+
         if width < 100 or height < 100:
             return
         rect = pygame.Rect(xpos, ypos, width, height)
@@ -43,16 +97,73 @@ class MondrianNode(object):
                                       ypos + height * self.subdivide_point)
 
 
+def rasterize(tree, width=1024, height=768, border=3, min_size=100):
+    # the same picture as MondrianNode.draw, as a (height, width, 3) uint8 array without pygame.
+    # pixel bounds for all rectangles are computed in one go, then painted parents first
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    rows = tree.get_rectangles(width, height, min_size=min_size)
+    if not len(rows):
+        return pixels
+    x0 = np.clip(rows[:, 0].astype(int), 0, width)
+    y0 = np.clip(rows[:, 1].astype(int), 0, height)
+    x1 = np.clip((rows[:, 0] + rows[:, 2]).astype(int), 0, width)
+    y1 = np.clip((rows[:, 1] + rows[:, 3]).astype(int), 0, height)
+    colours = rows[:, 4:].astype(np.uint8)
+    for i in range(len(rows)):
+        pixels[y0[i]:y1[i], x0[i]:x1[i]] = colours[i]
+        pixels[y0[i]:y0[i] + border, x0[i]:x1[i]] = 0
+        pixels[max(y0[i], y1[i] - border):y1[i], x0[i]:x1[i]] = 0
+        pixels[y0[i]:y1[i], x0[i]:x0[i] + border] = 0
+        pixels[y0[i]:y1[i], max(x0[i], x1[i] - border):x1[i]] = 0
+    return pixels
+
+
+def save_random_tree(path, seed, width=1024, height=768, chance_of_end=0.0, max_levels=10.0):
+    tree = MondrianNode()
+    tree.generate(chance_of_end, max_levels, rng=random.Random(seed))
+    image.imsave(path, rasterize(tree, width, height))
+    return path
+
+
+def save_random_trees(count, path_format="mondrian_{}.png", seed=0, workers=1, width=1024, height=768,
+                      chance_of_end=0.0, max_levels=10.0):
+    # tree i is grown from seed + i, so the images do not depend on the number of workers
+    paths = [path_format.format(i) for i in range(count)]
+    seeds = [seed + i for i in range(count)]
+    if workers <= 1:
+        return [save_random_tree(path, tree_seed, width, height, chance_of_end, max_levels)
+                for path, tree_seed in zip(paths, seeds)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(save_random_tree, paths, seeds, [width] * count, [height] * count,
+                                 [chance_of_end] * count, [max_levels] * count))
+
+
 def main():
+    import pygame
+
+    pygame.init()
     tree = MondrianNode()
     tree.generate()
     screen = pygame.display.set_mode((1024, 768))
+    # the tree never changes, draw it once and only redraw when the window asks for it
+    tree.draw(screen, 1024, 768, 0, 0)
+    pygame.display.flip()
     while True:
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT: sys.exit()
-        tree.draw(screen, 1024, 768, 0, 0)
-        pygame.display.flip()
+        event = pygame.event.wait()
+        if event.type == pygame.QUIT: sys.exit()
+        if event.type == pygame.VIDEOEXPOSE:
+            tree.draw(screen, 1024, 768, 0, 0)
+            pygame.display.flip()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Mondrian trees, in a window or as image files")
+    parser.add_argument("--batch", type=int, default=None, help="write this many images instead of opening a window")
+    parser.add_argument("--output", default="mondrian_{}.png")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    if args.batch is None:
+        main()
+    else:
+        save_random_trees(args.batch, args.output, seed=args.seed, workers=args.workers)
@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 from shapely.affinity import rotate
 from shapely.geometry import *
 
+from utils import get_xy, quadratic_bezier
+
 
 def get_eclipse(a, b, center=(0, 0), rotation=0, use_radians=False, resolution=16):
     # equation: (x-x0)**2/a + (y-y0)**2/b = 1
@@ -44,35 +46,8 @@ def get_curve(line_string):
 
 
 def basic_curve(pointA, pointB, pointC):
-    if isinstance(pointA, Point):
-        ax = pointA.x
-        ay = pointA.y
-    else:
-        ax = pointA[0]
-        ay = pointA[1]
-    if isinstance(pointB, Point):
-        bx = pointB.x
-        by = pointB.y
-    else:
-        bx = pointB[0]
-        by = pointB[1]
-    if isinstance(pointC, Point):
-        cx = pointC.x
-        cy = pointC.y
-    else:
-        cx = pointC[0]
-        cy = pointC[1]
-
-    def bc(a, b, c, t):
-        return (1 - t) ** 2 * a + 2 * t * (1 - t) * b + t ** 2 * c
-
-    point_list = []
-    for i in range(100):
-        t = i / 100
-        x = bc(ax, bx, cx, t)
-        y = bc(ay, by, cy, t)
-        point_list.append((x, y))
-    return point_list
+    curve = quadratic_bezier(get_xy(pointA), get_xy(pointB), get_xy(pointC), 100)[0]
+    return [tuple(point) for point in curve.tolist()]
 
 
 def mod(i, module):
@@ -0,0 +1,86 @@
+import numpy as np
+from shapely.geometry import MultiPolygon
+
+from utils import get_corners_batch, corners_to_polygons
+
+
+class CompactPlan(object):
+    # a plan as arrays of building centers, angles and dimensions; the Shapely geometry is only
+    # built when asked for. buildings of one plan never overlap, so no union is needed for it
+    __slots__ = ("cx", "cy", "angle", "length", "width", "_geometry")
+
+    def __init__(self, cx=(), cy=(), angle=(), length=(), width=()):
+        self.cx = np.asarray(cx, dtype=float)
+        self.cy = np.asarray(cy, dtype=float)
+        self.angle = np.asarray(angle, dtype=float)
+        self.length = np.asarray(length, dtype=float)
+        self.width = np.asarray(width, dtype=float)
+        self._geometry = None
+
+    @classmethod
+    def from_placements(cls, placements):
+        if not placements:
+            return cls()
+        return cls(*np.asarray(placements, dtype=float).T)
+
+    @classmethod
+    def from_array(cls, array):
+        array = np.asarray(array, dtype=float).reshape(-1, 5)
+        return cls(*array.T)
+
+    def to_array(self):
+        return np.stack([self.cx, self.cy, self.angle, self.length, self.width], axis=1)
+
+    def __len__(self):
+        return len(self.cx)
+
+    def __getstate__(self):
+        return self.to_array()
+
+    def __setstate__(self, state):
+        self.__init__(*np.asarray(state).reshape(-1, 5).T)
+
+    @property
+    def nbytes(self):
+        return self.cx.nbytes + self.cy.nbytes + self.angle.nbytes + self.length.nbytes + self.width.nbytes
+
+    @property
+    def areas(self):
+        return self.length * self.width
+
+    @property
+    def total_area(self):
+        return float(self.areas.sum())
+
+    def corners(self):
+        return get_corners_batch(self.length, self.width, self.angle, np.stack([self.cx, self.cy], axis=1))
+
+    def buildings(self):
+        return corners_to_polygons(self.corners())
+
+    @property
+    def geometry(self):
+        if self._geometry is None:
+            self._geometry = MultiPolygon(self.buildings())
+        return self._geometry
+
+    def filter(self, mask):
+        mask = np.asarray(mask)
+        return CompactPlan(self.cx[mask], self.cy[mask], self.angle[mask], self.length[mask], self.width[mask])
+
+    def equals(self, other, tolerance=1e-9):
+        if len(self) != len(other):
+            return False
+        # the same buildings in any order
+        mine = self.to_array()
+        theirs = other.to_array()
+        mine = mine[np.lexsort(mine.T[::-1])]
+        theirs = theirs[np.lexsort(theirs.T[::-1])]
+        return bool(np.allclose(mine, theirs, rtol=0, atol=tolerance))
+
+
+def get_plan_scores(plans, weights=(1.0, 0.0)):
+    # building count and built area of every plan, combined as weights[0] * count + weights[1] * area
+    counts = np.array([len(plan) for plan in plans], dtype=float)
+    areas = np.array([plan.total_area for plan in plans])
+    return weights[0] * counts + weights[1] * areas
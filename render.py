@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import geopandas as gpd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from collision import get_parts
+
+
+def render_plan(path, overall_buildings, divisions, base):
+    list_to_display = []
+    list_to_display.extend(get_parts(overall_buildings))
+    list_to_display.extend(divisions)
+    list_to_display.append(base)
+    # a bare Agg figure is never registered with pyplot, so nothing is left open once it is saved
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    gpd.GeoSeries(list_to_display).plot(ax=axes)
+    figure.savefig(path)
+    figure.clear()
+    return path
+
+
+class PlanRenderer(object):
+    # renders finished plans in the background so the compute loop only hands them over
+    def __init__(self, workers=1, processes=False, path_format="{}.png"):
+        if processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.path_format = path_format
+        self.futures = []
+
+    def submit(self, index, overall_buildings, divisions, base):
+        future = self.executor.submit(render_plan, self.path_format.format(index), overall_buildings, divisions,
+                                      base)
+        self.futures.append(future)
+        return future
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        return [future.result() for future in self.futures]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,101 @@
+import numpy as np
+from shapely.geometry import LineString
+from shapely.prepared import prep
+
+from collision import get_parts
+
+
+class SiteProfile(object):
+    # what the pipeline stages need to know about a base, worked out once and shared by all of
+    # them instead of being derived again by every call. it pickles with everything computed so
+    # far except the prepared geometries, which are prepared again on first use in the worker
+    def __init__(self, base):
+        self.base = base
+        self.area = base.area
+        self.envelope_bounds = base.envelope.bounds
+        # the geometry is only built when a stage first asks for it, so stages that only need the
+        # bounds, buffers or masks accept any areal base (holes, several parts)
+        self.buffers = {}
+        self.masks = {}
+        self.prepared = {}
+        self.edges = {}
+        self.edge_centroids = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["prepared"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    @property
+    def coords(self):
+        # the exterior ring, of the largest part for a MultiPolygon. edge i goes from coords[i] to
+        # coords[i + 1], wrapping around as get_entrances always did, so the last edge (closing
+        # point to first point) has length 0
+        if "coords" not in self.edges:
+            outline = max(get_parts(self.base), key=lambda part: part.area).exterior
+            self.edges["coords"] = np.asarray(outline.coords)[:, :2]
+        return self.edges["coords"]
+
+    @property
+    def edges_by_length(self):
+        # longest first, ties in boundary order
+        if "by_length" not in self.edges:
+            lengths = np.hypot(*(np.roll(self.coords, -1, axis=0) - self.coords).T)
+            self.edges["by_length"] = np.argsort(-lengths, kind="stable")
+        return self.edges["by_length"]
+
+    def get_edge_centroid(self, i):
+        # the centroid GEOS gives for edge i, so entrances are exactly where they always were
+        if i not in self.edge_centroids:
+            end = (i + 1) % len(self.coords)
+            self.edge_centroids[i] = LineString([self.coords[i], self.coords[end]]).centroid
+        return self.edge_centroids[i]
+
+    def get_buffer(self, distance):
+        if distance not in self.buffers:
+            self.buffers[distance] = self.base.buffer(distance)
+        return self.buffers[distance]
+
+    def precompute(self, inward_buffers=(-15,)):
+        # builds the geometry up front, so copies sent to worker processes carry it along
+        for distance in inward_buffers:
+            self.get_buffer(distance)
+        self.exterior_mask
+        self.road_mask
+        return self
+
+    @property
+    def exterior_mask(self):
+        # everything around the base out to a little past its envelope, the static shadow of every plan
+        if "exterior" not in self.masks:
+            self.masks["exterior"] = self.base.symmetric_difference(self.base.envelope.buffer(1))
+        return self.masks["exterior"]
+
+    @property
+    def road_mask(self):
+        # the outside of the base within its envelope, shrunk by 5: roads must not cross it
+        if "road" not in self.masks:
+            self.masks["road"] = self.base.symmetric_difference(self.base.envelope).buffer(-5)
+        return self.masks["road"]
+
+    @property
+    def prepared_road_mask(self):
+        if "road" not in self.prepared:
+            self.prepared["road"] = prep(self.road_mask)
+        return self.prepared["road"]
+
+
+def get_site_profile(base):
+    if isinstance(base, SiteProfile):
+        return base
+    return SiteProfile(base)
+
+
+def get_base(base):
+    # the polygon of a base or of its SiteProfile
+    if isinstance(base, SiteProfile):
+        return base.base
+    return base
@@ -14,19 +14,34 @@
 #
 #	(!) duplicate points will result in undefined behavior
 #
+#	--> triangulate_points(points)
+#		incremental Delaunay triangulation (Lawson flips) for larger point sets:
+#		points are inserted in a biased randomized order (random rounds, each
+#		spatially sorted), located by walking the triangle adjacency from the
+#		last insertion, and kept in flat index lists. the hull is closed with
+#		ghost triangles on a vertex at infinity instead of a supertriangle.
+#		it keeps no module state, so it can be called from several threads.
+#		returns a Triangulation with the points, the (M, 3) counter-clockwise
+#		triangles as indices into points, and the (M, 3) neighbors, where
+#		neighbors[t][i] is the triangle opposite to vertex i (-1 on the hull).
+#		duplicate points are skipped.
+#
 
 
 
-def getTriangulation(vertex_list):
-    global V
+import math
+
+import numpy as np
+
 
+def getTriangulation(vertex_list):
     V = vertex_list
 
     # initialize the triangle list
     triangle_list = []
 
     # determine the supertriangle
-    superTriangle = getSuperTriangle()
+    superTriangle = getSuperTriangle(V)
 
     # add the supertriangle to the triangle list
     triangle_list.append(superTriangle)
@@ -77,7 +92,7 @@ def getTriangulation(vertex_list):
     return [V, triangle_list]
 
 
-def getSuperTriangle():
+def getSuperTriangle(V):
     # find the maximum and minimum vertex bounds.
     # this is to allow calculation of the bounding triangle
 
@@ -111,6 +126,275 @@ def getSuperTriangle():
     return Triangle(V1, V2, V3)
 
 
+#######################################################################################################################################
+
+class Triangulation(object):
+    __slots__ = ("points", "triangles", "neighbors")
+
+    def __init__(self, points, triangles, neighbors):
+        self.points = points
+        self.triangles = triangles
+        self.neighbors = neighbors
+
+    def edges(self):
+        # unique (i, j) vertex pairs, i < j
+        edges = np.concatenate([self.triangles[:, [0, 1]], self.triangles[:, [1, 2]], self.triangles[:, [2, 0]]])
+        edges.sort(axis=1)
+        return np.unique(edges, axis=0)
+
+
+    def area(self):
+        p = self.points[self.triangles]
+        return float(((p[:, 1, 0] - p[:, 0, 0]) * (p[:, 2, 1] - p[:, 0, 1]) -
+                      (p[:, 1, 1] - p[:, 0, 1]) * (p[:, 2, 0] - p[:, 0, 0])).sum() / 2.0)
+
+    def covers_hull(self, tolerance=1e-9):
+        # a Delaunay triangulation fills the convex hull of its points exactly
+        hull = getHullArea(self.points)
+        return abs(self.area() - hull) <= tolerance * max(hull, 1.0)
+
+
+def getHullArea(points):
+    # monotone chain convex hull, shoelace area
+    points = sorted(set(map(tuple, np.asarray(points, dtype=float).tolist())))
+    if len(points) < 3:
+        return 0.0
+
+    def chain(points):
+        hull = []
+        for p in points:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0]) * (p[1] - hull[-2][1]) -
+                                      (hull[-1][1] - hull[-2][1]) * (p[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(p)
+        return hull[:-1]
+
+    hull = chain(points) + chain(points[::-1])
+    return abs(sum(hull[i][0] * hull[i - 1][1] - hull[i - 1][0] * hull[i][1] for i in range(len(hull)))) / 2.0
+
+
+def getSnakeOrder(points):
+    # snake order over a coarse grid, so consecutive points are close and the walks stay short
+    n = len(points)
+    cells = max(1, int(math.sqrt(n / 4.0)))
+    mins = points.min(axis=0)
+    spans = points.max(axis=0) - mins
+    spans[spans == 0] = 1.0
+    cell = np.minimum(((points - mins) / spans * cells).astype(int), cells - 1)
+    column = np.where(cell[:, 1] % 2 == 0, cell[:, 0], cells - 1 - cell[:, 0])
+    return np.lexsort((column, cell[:, 1]))
+
+
+def getInsertionOrder(points):
+    # biased randomized insertion order: the points are dealt at random (with a fixed seed) into rounds
+    # of 1, 2, 4, ... points and every round is inserted in snake order. the random rounds keep the
+    # flips per insertion low even on boundaries, where a plain snake order re-flips a whole side for
+    # every point, and the snake order within a round keeps the walks short
+    n = len(points)
+    rounds = np.floor(np.log2(np.random.RandomState(0).permutation(n) + 1)).astype(int)
+    order = []
+    for r in range(rounds.max() + 1 if n else 0):
+        members = np.nonzero(rounds == r)[0]
+        order.append(members[getSnakeOrder(points[members])])
+    return np.concatenate(order) if order else np.arange(0)
+
+
+def triangulate_points(points):
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    n = len(points)
+    if n < 3:
+        return Triangulation(points, np.empty((0, 3), dtype=int), np.empty((0, 3), dtype=int))
+
+    order = getInsertionOrder(points)
+    xmin, ymin = points.min(axis=0)
+    xmax, ymax = points.max(axis=0)
+    dmax = max(xmax - xmin, ymax - ymin) or 1.0
+    # orientations this close to zero count as collinear, densified boundaries are full of
+    # points that are collinear up to rounding
+    eps = 1e-10 * dmax * dmax
+    X = points[order, 0].tolist()
+    Y = points[order, 1].tolist()
+
+    # the hull is closed with ghost triangles (a, b, G) on a ghost vertex G at infinity, one for every
+    # hull edge, so there is no finite supertriangle whose far vertices distort the flips near the hull.
+    # a real triangle t is V[3t:3t+3], counter-clockwise; a ghost triangle lists its hull edge the other
+    # way round, so a point is in it when it is strictly left of that edge (outside the hull).
+    # N[3t+i] is the triangle across the edge opposite V[3t+i]
+    G = n
+
+    def orient(a, b, p):
+        return (X[b] - X[a]) * (Y[p] - Y[a]) - (Y[b] - Y[a]) * (X[p] - X[a])
+
+    def in_circle(a, b, c, d):
+        adx = X[a] - X[d]
+        ady = Y[a] - Y[d]
+        bdx = X[b] - X[d]
+        bdy = Y[b] - Y[d]
+        cdx = X[c] - X[d]
+        cdy = Y[c] - Y[d]
+        return ((adx * adx + ady * ady) * (bdx * cdy - cdx * bdy) +
+                (bdx * bdx + bdy * bdy) * (cdx * ady - adx * cdy) +
+                (cdx * cdx + cdy * cdy) * (adx * bdy - bdx * ady)) > 0
+
+    def must_flip(p, a, b, d):
+        # whether edge (a, b) of the triangle (p, a, b) must be flipped towards d. G is never inside a
+        # circle; a point is inside the circle of a ghost triangle when it is outside its hull edge
+        if d == G:
+            return False
+        if a == G:
+            return orient(d, b, p) > eps
+        if b == G:
+            return orient(a, d, p) > eps
+        return in_circle(p, a, b, d)
+
+    # the first triangle: two distinct points and a third one off their line
+    first = 0
+    second = next((k for k in range(1, n) if X[k] != X[first] or Y[k] != Y[first]), None)
+    if second is None:
+        return Triangulation(points, np.empty((0, 3), dtype=int), np.empty((0, 3), dtype=int))
+    third = next((k for k in range(second + 1, n) if abs(orient(first, second, k)) > eps), None)
+    if third is None:
+        # all points on one line
+        return Triangulation(points, np.empty((0, 3), dtype=int), np.empty((0, 3), dtype=int))
+    a, b, c = (first, second, third) if orient(first, second, third) > 0 else (first, third, second)
+    V = [a, b, c, c, b, G, a, c, G, b, a, G]
+    N = [1, 2, 3, 3, 2, 0, 1, 3, 0, 2, 1, 0]
+
+    def is_ghost(t):
+        return G in V[3 * t:3 * t + 3]
+
+    def ghost_edge(t):
+        # the hull edge of a ghost triangle, in its own (outward) order
+        base = 3 * t
+        k = V[base:base + 3].index(G)
+        return V[base + (k + 1) % 3], V[base + (k + 2) % 3]
+
+    def replace_neighbor(t, old, new):
+        if t != -1:
+            base = 3 * t
+            for i in range(3):
+                if N[base + i] == old:
+                    N[base + i] = new
+                    return
+
+    def scan(p):
+        # the triangle p is least outside of, for when the walk cycles on a degenerate configuration
+        real = [t for t in range(len(V) // 3) if not is_ghost(t)]
+        t = max(real, key=lambda t: min(orient(V[3 * t + (i + 1) % 3], V[3 * t + (i + 2) % 3], p) for i in range(3)))
+        if min(orient(V[3 * t + (i + 1) % 3], V[3 * t + (i + 2) % 3], p) for i in range(3)) >= -eps:
+            return t
+        ghosts = [t for t in range(len(V) // 3) if is_ghost(t)]
+        t = max(ghosts, key=lambda t: orient(*(ghost_edge(t) + (p,))))
+        return t if orient(*(ghost_edge(t) + (p,))) > eps else None
+
+    def locate(p, t):
+        # walks from real triangle t towards p, returns the real triangle holding p or, when p is outside
+        # the hull, a ghost triangle whose hull edge p sees
+        steps = 0
+        while True:
+            base = 3 * t
+            for i in range(3):
+                if orient(V[base + (i + 1) % 3], V[base + (i + 2) % 3], p) < -eps:
+                    t = N[base + i]
+                    break
+            else:
+                return t
+            if is_ghost(t):
+                return t
+            steps += 1
+            if steps > len(V):
+                return scan(p)
+
+    def new_triangle():
+        V.extend((-1, -1, -1))
+        N.extend((-1, -1, -1))
+        return len(V) // 3 - 1
+
+    def set_triangle(t, vertices, neighbors):
+        V[3 * t:3 * t + 3] = vertices
+        N[3 * t:3 * t + 3] = neighbors
+
+    last = 0
+    for p in range(n):
+        if p in (a, b, c):
+            continue
+        t = locate(p, last)
+        if t is None:
+            continue
+        base = 3 * t
+        if is_ghost(t):
+            on_edge = []
+        else:
+            sides = [orient(V[base + (i + 1) % 3], V[base + (i + 2) % 3], p) for i in range(3)]
+            on_edge = [i for i in range(3) if abs(sides[i]) <= eps]
+            if len(on_edge) > 1:
+                # same position as an existing vertex
+                continue
+        if on_edge:
+            # on the edge opposite i, the triangle across it (a ghost one on the hull) is split too
+            i = on_edge[0]
+            pa, pb, pc = V[base + i], V[base + (i + 1) % 3], V[base + (i + 2) % 3]
+            u, nb, nc = N[base + i], N[base + (i + 1) % 3], N[base + (i + 2) % 3]
+            ubase = 3 * u
+            j = [N[ubase + k] for k in range(3)].index(t)
+            d = V[ubase + j]
+            u_opp_c, u_opp_b = N[ubase + (j + 1) % 3], N[ubase + (j + 2) % 3]
+            t2 = new_triangle()
+            t4 = new_triangle()
+            set_triangle(t, (p, pc, pa), (nb, t2, t4))
+            set_triangle(t2, (p, pa, pb), (nc, u, t))
+            set_triangle(u, (p, pb, d), (u_opp_c, t4, t2))
+            set_triangle(t4, (p, d, pc), (u_opp_b, t, u))
+            replace_neighbor(nc, t, t2)
+            replace_neighbor(u_opp_b, u, t4)
+            stack = [t, t2, u, t4]
+        else:
+            # inside a real triangle, or outside the hull in a ghost one, which then becomes the real
+            # triangle on its hull edge and two ghost triangles on the new hull edges
+            pa, pb, pc = V[base], V[base + 1], V[base + 2]
+            na, nb, nc = N[base], N[base + 1], N[base + 2]
+            t1 = new_triangle()
+            t2 = new_triangle()
+            set_triangle(t, (p, pb, pc), (na, t1, t2))
+            set_triangle(t1, (p, pc, pa), (nb, t2, t))
+            set_triangle(t2, (p, pa, pb), (nc, t, t1))
+            replace_neighbor(nb, t, t1)
+            replace_neighbor(nc, t, t2)
+            stack = [t, t1, t2]
+
+        # restore the Delaunay property on the edges opposite to p (p is always vertex 0 here); on the
+        # hull this also turns the ghost triangles whose edges p sees into real ones
+        while stack:
+            t = stack.pop()
+            base = 3 * t
+            u = N[base]
+            pa, pb = V[base + 1], V[base + 2]
+            ubase = 3 * u
+            j = [N[ubase + k] for k in range(3)].index(t)
+            d = V[ubase + j]
+            if not must_flip(p, pa, pb, d):
+                continue
+            u_nb, u_na = N[ubase + (j + 1) % 3], N[ubase + (j + 2) % 3]
+            t_na, t_nb = N[base + 1], N[base + 2]
+            set_triangle(t, (p, pa, d), (u_nb, u, t_nb))
+            set_triangle(u, (p, d, pb), (u_na, t_na, t))
+            replace_neighbor(u_nb, u, t)
+            replace_neighbor(t_na, t, u)
+            stack.append(t)
+            stack.append(u)
+        last = t if not is_ghost(t) else N[3 * t + V[3 * t:3 * t + 3].index(G)]
+
+    # drop the ghost triangles and map back to the input indices
+    vertices = np.array(V, dtype=int).reshape(-1, 3)
+    neighbors = np.array(N, dtype=int).reshape(-1, 3)
+    keep = (vertices != G).all(axis=1)
+    new_index = np.full(len(vertices) + 1, -1, dtype=int)
+    new_index[:-1][keep] = np.arange(keep.sum())
+    triangles = order[vertices[keep]]
+    neighbors = new_index[neighbors[keep]]
+    return Triangulation(points, triangles, neighbors)
+
+
 #######################################################################################################################################
 
 class Vertex:
@@ -201,3 +485,33 @@ class Triangle:
 
         #    return((drsqr - *rsqr) <= EPSILON ? TRUE : FALSE);
         return True if ((drsqr - self.circumcircle_radius) <= self.EPSILON) else False
+
+
+if __name__ == "__main__":
+    import time
+
+    # self-check: random point sets, a grid with duplicates and a densified square must all be
+    # triangulated over their whole convex hull
+    rng = np.random.RandomState(0)
+    sets = [rng.rand(n, 2) for n in (50, 500, 5000) for k in range(5)]
+    grid = np.stack(np.meshgrid(np.arange(20), np.arange(20)), -1).reshape(-1, 2).astype(float)
+    sets.append(np.vstack([grid, grid[:50]]))
+
+    def get_square(n):
+        t = np.linspace(0, 1, n // 4, endpoint=False)
+        return np.concatenate([np.stack([t, 0 * t], 1), np.stack([1 + 0 * t, t], 1),
+                               np.stack([1 - t, 1 + 0 * t], 1), np.stack([0 * t, 1 - t], 1)]) * 100
+
+    sets.append(get_square(200))
+    failed = [i for i, points in enumerate(sets) if not triangulate_points(points).covers_hull()]
+    print("{} of {} point sets do not cover their hull".format(len(failed), len(sets)))
+
+    # a densified boundary (as centerline.densify_boundary makes) must not be much slower than as many
+    # random points: collinear runs used to make every insertion re-flip a whole side
+    timings = []
+    for points in (rng.rand(8000, 2) * 100, get_square(8000)):
+        start = time.time()
+        covers = triangulate_points(points).covers_hull()
+        timings.append(time.time() - start)
+    print("8000 random points {:.2f}s, 8000 points on a square {:.2f}s{}".format(
+        timings[0], timings[1], "" if covers and timings[1] <= 4 * timings[0] + 0.1 else " (too slow or not covering)"))
@@ -1,9 +1,18 @@
 import copy
+import functools
 import math
 import random
 
+import numpy as np
+from shapely import vectorized
+from shapely.affinity import translate
 from shapely.geometry import *
-from shapely.ops import cascaded_union
+from shapely.ops import cascaded_union, split
+from shapely.prepared import prep
+
+import instrumentation
+from collision import CollisionEngine
+from site_profile import get_site_profile, get_base
 
 
 def get_corners(length, width, rotate_angle, center):
@@ -28,11 +37,46 @@ def get_corners(length, width, rotate_angle, center):
     return corners
 
 
+def get_corners_batch(length, width, rotate_angle, centers):
+    # same corner order as get_corners, for N centers at once; length, width and
+    # rotate_angle may be scalars or arrays of length N. returns an (N, 4, 2) array
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    half_length = np.broadcast_to(np.asarray(length, dtype=float) / 2, (len(centers),))
+    half_width = np.broadcast_to(np.asarray(width, dtype=float) / 2, (len(centers),))
+    rotate_angle = np.radians(np.broadcast_to(np.asarray(rotate_angle, dtype=float), (len(centers),)))
+    local_x = np.stack([half_length, half_length, -half_length, -half_length], axis=1)
+    local_y = np.stack([-half_width, half_width, half_width, -half_width], axis=1)
+    cos = np.cos(rotate_angle)[:, None]
+    sin = np.sin(rotate_angle)[:, None]
+    corners = np.empty((len(centers), 4, 2))
+    corners[:, :, 0] = local_x * cos - local_y * sin + centers[:, 0:1]
+    corners[:, :, 1] = local_x * sin + local_y * cos + centers[:, 1:2]
+    return corners
+
+
 def get_building(length, width, rotate_angle, center=(0, 0)):
     corners = get_corners(length, width, rotate_angle, center)
     return Polygon(corners)
 
 
+def get_buildings_batch(length, width, rotate_angle, centers):
+    return corners_to_polygons(get_corners_batch(length, width, rotate_angle, centers))
+
+
+def corners_to_polygons(corners):
+    return [Polygon(building_corners) for building_corners in corners]
+
+
+def get_edge_centers(start_point, end_point, n, rng=random):
+    # candidate centers every 1/n of the edge, visited from a random offset drawn per step
+    ks = np.array([rng.randint(0, n - 1) for j in range(n)], dtype=int)
+    steps = (np.arange(n) + ks) % n
+    centers = np.empty((n, 2))
+    centers[:, 0] = start_point[0] + steps * (end_point[0] - start_point[0]) / n
+    centers[:, 1] = start_point[1] + steps * (end_point[1] - start_point[1]) / n
+    return centers
+
+
 def get_building_shadow(length, width, rotation_angle, center=(0, 0), h=80):
     shadow_list = []
     shadow_long = get_building(length=length + 2 * 13, width=width, rotate_angle=rotation_angle, center=center)
@@ -46,62 +90,220 @@ def get_building_shadow(length, width, rotation_angle, center=(0, 0), h=80):
     return shadow
 
 
-def get_curve(pointA, pointB, pointC):
-    if isinstance(pointA, Point):
-        ax = pointA.x
-        ay = pointA.y
-    else:
-        ax = pointA[0]
-        ay = pointA[1]
-    if isinstance(pointB, Point):
-        bx = pointB.x
-        by = pointB.y
-    else:
-        bx = pointB[0]
-        by = pointB[1]
-    if isinstance(pointC, Point):
-        cx = pointC.x
-        cy = pointC.y
+def get_shadow_rectangles(length, width, rotation_angle, center=(0, 0), h=80):
+    # the two rectangles get_building_shadow is made of, as (center, angle, length, width)
+    return [(center, rotation_angle, length + 2 * 13, width), (center, rotation_angle, length, 2 * h)]
+
+
+def get_interaction_distance(length, width, h=80):
+    # two buildings can only get in each other's way when their centers are closer than the
+    # shadow's reach from its center plus the building's half diagonal
+    half_diagonal = math.hypot(length / 2, width / 2)
+    reach = max(math.hypot(length / 2 + 13, width / 2), math.hypot(length / 2, h), half_diagonal + 6)
+    return reach + half_diagonal
+
+
+@functools.lru_cache(maxsize=1024)
+def get_shadow_template(length, width, rotation_angle, h=80):
+    # the shadow only depends on (length, width, angle, h), the center is a translation,
+    # so keep the coordinates of the shadow built around the origin
+    shadow = get_building_shadow(length, width, rotation_angle, center=(0, 0), h=h)
+    if not isinstance(shadow, Polygon):
+        return shadow, None
+    shell = np.asarray(shadow.exterior.coords)
+    holes = [np.asarray(interior.coords) for interior in shadow.interiors]
+    return shell, holes
+
+
+def get_cached_building_shadow(length, width, rotation_angle, center=(0, 0), h=80):
+    if isinstance(center, Point):
+        x = center.x
+        y = center.y
     else:
-        cx = pointC[0]
-        cy = pointC[1]
+        x = center[0]
+        y = center[1]
+    shell, holes = get_shadow_template(length, width, float(rotation_angle), h)
+    if holes is None:
+        return translate(shell, x, y)
+    offset = (x, y)
+    return Polygon(shell + offset, [hole + offset for hole in holes])
+
+
+def get_xy(point):
+    if isinstance(point, Point):
+        return point.x, point.y
+    return point[0], point[1]
+
+
+def quadratic_bezier(starts, controls, ends, samples=100, endpoint=False):
+    # evaluates N quadratic curves at the same samples at once: (N, 2) arrays in, (N, samples, 2) out.
+    # without endpoint the samples are t = i / samples, as the old per-point loops did
+    starts = np.asarray(starts, dtype=float).reshape(-1, 1, 2)
+    controls = np.asarray(controls, dtype=float).reshape(-1, 1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 1, 2)
+    t = np.arange(samples) / ((samples - 1) if endpoint else samples)
+    t = t.reshape(1, -1, 1)
+    return (1 - t) ** 2 * starts + 2 * t * (1 - t) * controls + t ** 2 * ends
+
+
+def get_adaptive_samples(starts, controls, ends, tolerance, max_samples=100):
+    # a quadratic curve cut into n equal parameter steps strays at most |a - 2b + c| / (4 n^2)
+    # from its chords, so take the smallest n that keeps this under the tolerance
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    controls = np.asarray(controls, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    bend = np.hypot(*(starts - 2 * controls + ends).T)
+    segments = np.ceil(np.sqrt(bend / (4.0 * tolerance))).astype(int)
+    return np.clip(segments, 1, max_samples - 1) + 1
+
+
+def get_curves(starts, controls, ends, samples=100, tolerance=None, endpoint=False):
+    # list of (k, 2) point arrays, one per curve. with a tolerance every curve gets its own
+    # sample count (endpoint included, at most samples points); curves with the same count
+    # are still evaluated together
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    controls = np.asarray(controls, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    if tolerance is None:
+        return list(quadratic_bezier(starts, controls, ends, samples, endpoint=endpoint))
+    counts = get_adaptive_samples(starts, controls, ends, tolerance, max_samples=samples)
+    curves = [None] * len(starts)
+    for count in np.unique(counts):
+        indices = np.nonzero(counts == count)[0]
+        points = quadratic_bezier(starts[indices], controls[indices], ends[indices], count, endpoint=True)
+        for index, curve in zip(indices, points):
+            curves[index] = curve
+    return curves
 
-    def bc(a, b, c, t):
-        return (1 - t) ** 2 * a + 2 * t * (1 - t) * b + t ** 2 * c
 
-    point_list = []
-    for i in range(100):
-        t = i / 100
-        x = bc(ax, bx, cx, t)
-        y = bc(ay, by, cy, t)
-        point_list.append((x, y))
-    return LineString(point_list)
+def get_curve(pointA, pointB, pointC, samples=100, tolerance=None):
+    curve = get_curves([get_xy(pointA)], [get_xy(pointB)], [get_xy(pointC)], samples=samples,
+                       tolerance=tolerance)[0]
+    return LineString(curve)
+
+
+def get_close_pairs(points, max_distance):
+    # index pairs (i, j), i < j, of points closer than max_distance, found through a grid hash
+    # with max_distance cells so only the 3 x 3 cells around each point are compared
+    cells = {}
+    keys = []
+    for index, (x, y) in enumerate(points):
+        key = (int(math.floor(x / max_distance)), int(math.floor(y / max_distance)))
+        keys.append(key)
+        cells.setdefault(key, []).append(index)
+    pairs = []
+    for index, (x, y) in enumerate(points):
+        i, j = keys[index]
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for other in cells.get((i + di, j + dj), ()):
+                    if other > index and math.hypot(points[other][0] - x, points[other][1] - y) < max_distance:
+                        pairs.append((index, other))
+    pairs.sort()
+    return pairs
 
 
 def get_roads_v2(collection, base, max_distance):
-    roads = []
-    outside = base.symmetric_difference(base.envelope).buffer(-5)
-    for i in range(len(collection) - 1):
-        for j in range(i + 1, len(collection)):
-            element1 = collection[i]
-            element2 = collection[j]
-            if element1.centroid.distance(element2.centroid) < max_distance:
-                line = LineString([element1.centroid, element2.centroid])
-                if not line.intersects(outside):
-                    roads.append(line)
+    outside = get_site_profile(base).prepared_road_mask
+    centroids = [element.centroid.coords[0] for element in collection]
+    lines = [LineString([centroids[i], centroids[j]]) for i, j in get_close_pairs(centroids, max_distance)]
+    roads = [line for line in lines if not outside.intersects(line)]
+    if instrumentation.enabled:
+        instrumentation.gauge("get_roads_v2.candidates", len(lines))
+        instrumentation.gauge("get_roads_v2.roads", len(roads))
     return roads
 
 
-def get_entrances(base, entrances_count=2, distance=100):
-    coords = base.boundary.coords
-    lines = []
-    for i in range(len(coords)):
-        line = LineString([coords[i % len(coords)], coords[(i + 1) % len(coords)]])
-        lines.append(line)
-    lines = sorted(lines, key=lambda line: line.length, reverse=True)
-    entrances = [lines[0].centroid]
-    for i in range(1, len(lines)):
-        entrance = lines[i].centroid
+def get_reflex_vertices(polygon, min_angle=0):
+    # indices into the exterior coords (closing point left out) of the vertices where the
+    # boundary turns against its orientation by more than min_angle degrees, and those turns
+    coords = np.asarray(get_base(polygon).exterior.coords)[:-1, :2]
+    incoming = coords - np.roll(coords, 1, axis=0)
+    outgoing = np.roll(coords, -1, axis=0) - coords
+    cross = incoming[:, 0] * outgoing[:, 1] - incoming[:, 1] * outgoing[:, 0]
+    dot = (incoming * outgoing).sum(axis=1)
+    # shoelace sign: positive for a counter-clockwise ring
+    orientation = np.sign(np.sum(coords[:, 0] * np.roll(coords[:, 1], -1) - np.roll(coords[:, 0], -1) * coords[:, 1]))
+    turns = -np.degrees(np.arctan2(cross * orientation, dot))
+    indices = np.nonzero(turns > min_angle)[0]
+    return indices, turns[indices]
+
+
+def get_reflex_cuts(polygon, min_angle=0):
+    # for every reflex vertex, its two edges carried on into the polygon up to the boundary
+    polygon = get_base(polygon)
+    coords = np.asarray(polygon.exterior.coords)[:-1, :2]
+    minx, miny, maxx, maxy = polygon.bounds
+    reach = 2 * math.hypot(maxx - minx, maxy - miny)
+    boundary = polygon.boundary
+    cuts = []
+    for index in get_reflex_vertices(polygon, min_angle)[0].tolist():
+        vertex = coords[index]
+        for neighbour in (coords[index - 1], coords[(index + 1) % len(coords)]):
+            direction = vertex - neighbour
+            direction = direction / np.hypot(*direction)
+            ray = LineString([vertex, vertex + direction * reach])
+            hits = [point for point in get_points(ray.intersection(boundary))
+                    if math.hypot(point.x - vertex[0], point.y - vertex[1]) > 1e-6]
+            if not hits:
+                continue
+            hit = min(hits, key=lambda point: math.hypot(point.x - vertex[0], point.y - vertex[1]))
+            # a little past the boundary, so the split always goes through
+            end = np.array([hit.x, hit.y]) + direction * 1e-6
+            cuts.append(LineString([vertex, end]))
+    return cuts
+
+
+def get_points(geom):
+    # the points of an intersection result, segments count by their ends
+    if geom.is_empty:
+        return []
+    if hasattr(geom, "geoms"):
+        return [point for part in geom.geoms for point in get_points(part)]
+    return [Point(coord) for coord in geom.coords]
+
+
+def split_convex(polygon, min_angle=10, min_area=0, max_parts=16):
+    # near-convex parts (no turn against the boundary sharper than min_angle), cutting every time
+    # along the shortest edge extension of a reflex vertex. a cut never leaves a part smaller than
+    # min_area, and cutting stops at max_parts
+    parts = []
+    pending = [get_base(polygon)]
+    while pending:
+        part = pending.pop()
+        if len(parts) + len(pending) + 1 >= max_parts:
+            parts.append(part)
+            continue
+        pieces = None
+        for cut in sorted(get_reflex_cuts(part, min_angle), key=lambda line: line.length):
+            pieces = [piece for piece in split(part, cut) if piece.area > 1e-6]
+            if len(pieces) > 1 and min(piece.area for piece in pieces) >= min_area:
+                break
+            pieces = None
+        if pieces is None:
+            parts.append(part)
+        else:
+            pending.extend(pieces)
+    return sorted(parts, key=lambda geom: geom.area, reverse=True)
+
+
+def get_entrances(base, entrances_count=2, distance=100, parts=None):
+    # with the parts of a decomposed base, the first entrances go on the longest edge of each
+    # part in turn, so awkward bases are reached from more than one side
+    site = get_site_profile(base)
+    order = site.edges_by_length.tolist()
+    if parts is not None and len(parts) > 1:
+        firsts = []
+        for part in parts:
+            prepared = prep(part.buffer(1e-6))
+            for i in order:
+                if i not in firsts and prepared.contains(site.get_edge_centroid(i)):
+                    firsts.append(i)
+                    break
+        order = firsts + [i for i in order if i not in firsts]
+    entrances = [site.get_edge_centroid(order[0])]
+    for i in order[1:]:
+        entrance = site.get_edge_centroid(i)
         acceptable = True
         for other_entrance in entrances:
             if entrance.distance(other_entrance) < distance:
@@ -129,15 +331,33 @@ def get_buffered_sections(collection, buffer):
 
 
 def generate_plan(collection_buffered, overall_shadows, overall_buildings,
-                  building_length=32, building_width=16, shadow_h=80, fix_angle=None):
-    random.shuffle(collection_buffered)
+                  building_length=32, building_width=16, shadow_h=80, fix_angle=None, rng=random):
+    engine = CollisionEngine(overall_shadows, overall_buildings)
+    place_buildings(collection_buffered, engine, building_length=building_length, building_width=building_width,
+                    shadow_h=shadow_h, fix_angle=fix_angle, rng=rng)
+    return engine.get_buildings(), engine.get_shadows()
+
+
+def place_buildings(collection_buffered, engine,
+                    building_length=32, building_width=16, shadow_h=80, fix_angle=None, rng=random):
+    for section in iter_place_buildings(collection_buffered, engine, building_length=building_length,
+                                        building_width=building_width, shadow_h=shadow_h, fix_angle=fix_angle,
+                                        rng=rng):
+        pass
+    return engine
+
+
+def iter_place_buildings(collection_buffered, engine,
+                         building_length=32, building_width=16, shadow_h=80, fix_angle=None, rng=random):
+    # same as place_buildings, yielding every section once its buildings are placed
+    rng.shuffle(collection_buffered)
     for our_base in collection_buffered:
         building_line = our_base
         if building_line.is_empty:
             continue
         building_line = building_line.boundary
-        building_coords = building_line.coords
-        k = random.choice(range(len(building_coords)))
+        building_coords = list(building_line.coords)
+        k = rng.choice(range(len(building_coords)))
 
         for i in range(k, k + len(building_coords) - 1):
             start_point = building_coords[i % len(building_coords)]
@@ -146,99 +366,151 @@ def generate_plan(collection_buffered, overall_shadows, overall_buildings,
             starty = start_point[1]
             endx = end_point[0]
             endy = end_point[1]
-            line = LineString([start_point, end_point])
             if not fix_angle:
                 angle = math.degrees(math.atan2(endy - starty, endx - startx))
             else:
                 angle = fix_angle
-            n = int(line.length / 3)
+            n = int(math.hypot(endx - startx, endy - starty) / 3)
+            if instrumentation.enabled:
+                instrumentation.count("place_buildings.edges")
+                instrumentation.count("place_buildings.candidates", n)
+                instrumentation.gauge("place_buildings.candidates_per_edge", n)
+            if n == 0:
+                continue
+            centers = get_edge_centers(start_point, end_point, n, rng=rng)
+            corners = get_corners_batch(building_length, building_width, angle, centers)
+            corner_bounds = np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1).tolist()
+            # coverage only grows along the edge, so a raster check made up front stays valid
+            blocked = engine.raster_blocked(corners).tolist()
             for j in range(n):
-                k = random.randint(0, n - 1)
-                center = (
-                    startx + ((j + k) % n) * (endx - startx) / n, starty + ((j + k) % n) * (endy - starty) / n)
-                building = get_building(building_length, building_width, angle, center=center)
-                shadow = get_building_shadow(building_length, building_width, angle, center=center, h=shadow_h)
-                if not overall_buildings:
-                    if overall_shadows.intersects(building):
-                        continue
-                    else:
-                        overall_buildings = building
-                        overall_shadows = overall_shadows.union(shadow)
-                elif overall_shadows.intersects(building) or overall_buildings.intersects(shadow):
+                if blocked[j]:
+                    if instrumentation.enabled:
+                        instrumentation.count("place_buildings.rejected_by_raster")
                     continue
-                else:
-                    overall_shadows = overall_shadows.union(shadow)
-                    overall_buildings = overall_buildings.union(building)
-    return overall_buildings, overall_shadows
+                center = (centers[j, 0], centers[j, 1])
+                building = Polygon(corners[j])
+                with instrumentation.timer("place_buildings.shadow_test"):
+                    hit = engine.hits_shadows(building, corner_bounds[j])
+                if hit:
+                    if instrumentation.enabled:
+                        instrumentation.count("place_buildings.rejected_by_shadow")
+                    continue
+                shadow = get_cached_building_shadow(building_length, building_width, angle, center=center, h=shadow_h)
+                with instrumentation.timer("place_buildings.building_test"):
+                    hit = engine.hits_buildings(shadow)
+                if hit:
+                    if instrumentation.enabled:
+                        instrumentation.count("place_buildings.rejected_by_building")
+                    continue
+                engine.add(building, shadow,
+                           rectangles=get_shadow_rectangles(building_length, building_width, angle, center, h=shadow_h),
+                           placement=(center[0], center[1], angle, building_length, building_width))
+                if instrumentation.enabled:
+                    instrumentation.count("place_buildings.accepted")
+        yield our_base
+
+
+class CirclePacker(object):
+    # circles are kept as (x, y, r) in a grid hash over their centers; with cells at least
+    # as large as max_r plus the largest radius, every circle that can matter for a point
+    # is in the 3 x 3 cells around it
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.circles = []
+
+    def __len__(self):
+        return len(self.circles)
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def add(self, x, y, r):
+        self.circles.append((x, y, r))
+        self.cells.setdefault(self._cell(x, y), []).append(len(self.circles) - 1)
+
+    def nearest_distance(self, x, y):
+        # distance from (x, y) to the closest circle (0 inside one), None if no circle is close enough
+        i, j = self._cell(x, y)
+        min_distance = None
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                for index in self.cells.get((i + di, j + dj), ()):
+                    cx, cy, r = self.circles[index]
+                    distance = max(0.0, math.hypot(x - cx, y - cy) - r)
+                    if min_distance is None or distance < min_distance:
+                        min_distance = distance
+        return min_distance
+
 
+def get_circle(geom):
+    center = geom.centroid
+    radius = max(center.distance(Point(coord)) for coord in geom.exterior.coords)
+    return center.x, center.y, radius
 
-def generate_collection(base, min_r, max_r, density=20, resolution=4, entrace_collection=[]):
-    envelope = base.envelope
-    minx, miny, maxx, maxy = envelope.bounds
+
+def get_grid_points(base, density, inward_buffer=15):
+    site = get_site_profile(base)
+    minx, miny, maxx, maxy = site.envelope_bounds
     x_diff = maxx - minx
     y_diff = maxy - miny
-    point_list = []
-    for j in range(density):
-        for i in range(density):
-            point = Point(minx + x_diff / density * i, miny + y_diff / density * j)
-            if base.buffer(-15).contains(point):
-                point_list.append(point)
+    xs, ys = np.meshgrid(minx + x_diff / density * np.arange(density),
+                         miny + y_diff / density * np.arange(density))
+    xs = xs.ravel()
+    ys = ys.ravel()
+    inside = vectorized.contains(site.get_buffer(-inward_buffer), xs, ys)
+    return list(zip(xs[inside].tolist(), ys[inside].tolist()))
+
+
+def generate_collection(base, min_r, max_r, density=20, resolution=4, entrace_collection=[], rng=random,
+                        max_iteration=None):
+    # a pick farther than max_r from every circle is kept for later but still uses up an
+    # iteration, so by default the budget grows with the grid (200 at the default density of 20):
+    # a finer grid then gives a finer packing instead of running out of tries
+    if max_iteration is None:
+        max_iteration = density * density // 2
+    with instrumentation.timer("generate_collection.grid"):
+        point_list = get_grid_points(base, density)
+    if instrumentation.enabled:
+        instrumentation.gauge("generate_collection.grid_points", len(point_list))
 
     collection = copy.deepcopy(entrace_collection)
-    max_iteration = 200
+    existing = [get_circle(geom) for geom in collection]
+    largest_r = max([max_r + 1] + [r for x, y, r in existing])
+    packer = CirclePacker(cell_size=max_r + largest_r)
+    for x, y, r in existing:
+        packer.add(x, y, r)
+
     iter = 0
     while len(point_list) > 0 and iter < max_iteration:
         iter += 1
-        first_point = random.choice(point_list)
-        if len(collection) == 0:
-            r = random.randint(min_r, max_r)
-            circle = first_point.buffer(r, resolution)
-            collection.append(circle)
-            point_list.remove(first_point)
+        index = rng.randrange(len(point_list))
+        x, y = point_list[index]
+        if len(packer) == 0:
+            r = rng.randint(min_r, max_r)
         else:
-            distances = [first_point.distance(circle) for circle in collection]
-            min_distance = min(distances)
-            if min_distance < min_r:
-                point_list.remove(first_point)
-            elif min_distance > max_r:
+            min_distance = packer.nearest_distance(x, y)
+            if min_distance is None or min_distance > max_r:
                 continue
+            if min_distance < min_r:
+                r = None
             else:
-                circle = first_point.buffer(min_distance + 1, resolution)
-                collection.append(circle)
-                point_list.remove(first_point)
+                r = min_distance + 1
+        if r is not None:
+            packer.add(x, y, r)
+            collection.append(Point(x, y).buffer(r, resolution))
+        # swap with the last point instead of list.remove
+        point_list[index] = point_list[-1]
+        point_list.pop()
+    if instrumentation.enabled:
+        instrumentation.count("generate_collection.iterations", iter)
+        instrumentation.gauge("generate_collection.circles", len(collection))
     return collection
 
 
-def basic_curve(pointA, pointB, pointC):
-    if isinstance(pointA, Point):
-        ax = pointA.x
-        ay = pointA.y
-    else:
-        ax = pointA[0]
-        ay = pointA[1]
-    if isinstance(pointB, Point):
-        bx = pointB.x
-        by = pointB.y
-    else:
-        bx = pointB[0]
-        by = pointB[1]
-    if isinstance(pointC, Point):
-        cx = pointC.x
-        cy = pointC.y
-    else:
-        cx = pointC[0]
-        cy = pointC[1]
-
-    def bc(a, b, c, t):
-        return (1 - t) ** 2 * a + 2 * t * (1 - t) * b + t ** 2 * c
-
-    point_list = []
-    for i in range(8):
-        t = i / 8
-        x = bc(ax, bx, cx, t)
-        y = bc(ay, by, cy, t)
-        point_list.append((x, y))
-    return point_list
+def basic_curve(pointA, pointB, pointC, samples=8):
+    curve = quadratic_bezier(get_xy(pointA), get_xy(pointB), get_xy(pointC), samples)[0]
+    return [tuple(point) for point in curve.tolist()]
 
 
 def mod(i, module):
@@ -246,22 +518,61 @@ def mod(i, module):
 
 
 def smooth_polygon(polygon, min_length=20, multiple_start=True):
-    if not isinstance(polygon, Polygon):
-        return polygon
-    coords = polygon.boundary.coords
-    if multiple_start:
-        coords = coords[:-1]
-    tuple_list = []
-    n = len(coords)
-    for i in range(n):
-        last_coord = coords[mod(n + i - 1, n)]
-        this_coord = coords[i]
-        next_coord = coords[mod(n + i + 1, n)]
-        min_side_length = min(Point(next_coord).distance(Point(this_coord)),
-                              Point(last_coord).distance(Point(this_coord)))
-        rate = min(0.5, min_length / min_side_length)
-        s_point = (rate * last_coord[0] + (1 - rate) * this_coord[0], rate * last_coord[1] + (1 - rate) * this_coord[1])
-        e_point = (rate * next_coord[0] + (1 - rate) * this_coord[0], rate * next_coord[1] + (1 - rate) * this_coord[1])
-        curve = basic_curve(s_point, this_coord, e_point)
-        tuple_list.extend(curve)
-    return Polygon(tuple_list)
+    return smooth_polygons([polygon], min_length=min_length, multiple_start=multiple_start)[0]
+
+
+def smooth_polygons(polygons, min_length=20, multiple_start=True):
+    # fillets every corner of every ring (shells and holes, of polygons and of multipolygon parts)
+    # in one pass over the concatenated ring coordinates; anything else is returned as it is
+    rings = []
+    layouts = []
+    for polygon in polygons:
+        if isinstance(polygon, Polygon) and not polygon.is_empty:
+            parts = [polygon]
+        elif isinstance(polygon, MultiPolygon) and not polygon.is_empty:
+            parts = [part for part in polygon]
+        else:
+            layouts.append(None)
+            continue
+        layout = []
+        for part in parts:
+            ring_indices = []
+            for ring in [part.exterior] + list(part.interiors):
+                coords = np.asarray(ring.coords)
+                if multiple_start:
+                    coords = coords[:-1]
+                ring_indices.append(len(rings))
+                rings.append(coords)
+            layout.append(ring_indices)
+        layouts.append(layout)
+    if not rings:
+        return list(polygons)
+
+    lengths = np.array([len(ring) for ring in rings])
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    this_coords = np.concatenate(rings)
+    starts = np.repeat(offsets, lengths)
+    sizes = np.repeat(lengths, lengths)
+    local = np.arange(len(this_coords)) - starts
+    last_coords = this_coords[starts + (local - 1) % sizes]
+    next_coords = this_coords[starts + (local + 1) % sizes]
+    last_sides = last_coords - this_coords
+    next_sides = next_coords - this_coords
+    min_side_length = np.minimum(np.sqrt(next_sides[:, 0] ** 2 + next_sides[:, 1] ** 2),
+                                 np.sqrt(last_sides[:, 0] ** 2 + last_sides[:, 1] ** 2))
+    with np.errstate(divide="ignore"):
+        rate = np.minimum(0.5, min_length / min_side_length)[:, None]
+    s_points = rate * last_coords + (1 - rate) * this_coords
+    e_points = rate * next_coords + (1 - rate) * this_coords
+    curves = quadratic_bezier(s_points, this_coords, e_points, 8)
+    smoothed_rings = [curves[offset:offset + length].reshape(-1, 2) for offset, length in zip(offsets, lengths)]
+
+    smoothed = []
+    for polygon, layout in zip(polygons, layouts):
+        if layout is None:
+            smoothed.append(polygon)
+            continue
+        parts = [Polygon(smoothed_rings[ring_indices[0]], [smoothed_rings[index] for index in ring_indices[1:]])
+                 for ring_indices in layout]
+        smoothed.append(parts[0] if isinstance(polygon, Polygon) else MultiPolygon(parts))
+    return smoothed